@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 """
 Driver application for interfacing with a filesystem image that can generate
 information about the filesystem and enter an interactive shell.
@@ -8,12 +8,31 @@ __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 import sys
 import os
-from time import sleep, clock
-from threading import Thread
-from collections import deque
+import stat
+import posixpath
+from time import sleep
+try:
+  from time import perf_counter as clock
+except ImportError:
+  from time import clock
+from threading import Thread, Lock
+from multiprocessing import Process, Pipe
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
+from operator import attrgetter
 from ext2 import *
 
 
+# number of bytes of file data gathered from the image before each write to the host
+FETCH_CHUNK_SIZE = 1 << 20
+# number of threads used to fetch the files of a directory
+FETCH_MAX_WORKERS = 4
+# largest host file that is read into memory at once when put on the image
+PUT_WHOLE_FILE_SIZE = 8 << 20
+# row of a long directory listing: inode, mode, links, uid, gid, size, time and name
+LONG_LIST_FORMAT = "%s%s %2d %*d %*d %*d %-17s %s"
+
+
 class FilesystemNotSupportedError(Exception):
   """Thrown when the image's filesystem type is not supported."""
   pass
@@ -26,7 +45,8 @@ class ShellError(Exception):
 
 class WaitIndicatorThread(Thread):
   """Shows a wait indicator for the current action. If maxProgress is set then a
-  percentage towards completion is shown instead."""
+  percentage towards completion is shown instead. Nothing is shown when standard
+  output is not a terminal."""
   done = False
   progress = 0
   maxProgress = 0
@@ -34,34 +54,51 @@ class WaitIndicatorThread(Thread):
   def __init__(self, msg):
     Thread.__init__(self)
     self._msg = msg
-  
+    self._line = "\r{0} ".format(msg)
+    self._enabled = sys.stdout.isatty()
+    self._lastProgress = None
+    self._indpos = 0
+
+  def start(self):
+    """Starts showing the wait indicator, unless standard output is not a terminal."""
+    if not self._enabled:
+      self.done = True
+      return
+    Thread.start(self)
+
+  def join(self, timeout = None):
+    """Waits for the wait indicator to finish, if it was started."""
+    if self._enabled:
+      Thread.join(self, timeout)
+
+  def tick(self):
+    """Draws the next frame of the wait indicator, unless standard output is not a terminal."""
+    if not self._enabled:
+      return
+    if self.maxProgress == 0:
+      sys.stdout.write(self._line + "-\\|/"[self._indpos])
+      sys.stdout.flush()
+      self._indpos = (self._indpos + 1) % 4
+    elif self.progress != self._lastProgress:
+      sys.stdout.write("%s%.0f%%" % (self._line, float(self.progress) / self.maxProgress * 100))
+      sys.stdout.flush()
+      self._lastProgress = self.progress
+
+  def finish(self):
+    """Replaces the wait indicator with the done message, unless standard output is not a
+    terminal."""
+    if not self._enabled:
+      return
+    sys.stdout.write("{0}Done.".format(self._line))
+    sys.stdout.flush()
+    print()
+
   def run(self):
     """Prints and updates the wait indicator until done becomes True."""
-    lastProgress = None
-    indpos = 0
-    ind = ["-", "\\", "|", "/"]
     while not self.done:
-      if self.maxProgress == 0:
-        sys.stdout.write("\r")
-        sys.stdout.write(self._msg)
-        sys.stdout.write(" ")
-        sys.stdout.write(ind[indpos])
-        sys.stdout.flush()
-        indpos = (indpos + 1) % 4
-      else:
-        if self.progress != lastProgress:
-          sys.stdout.write("\r")
-          sys.stdout.write(self._msg)
-          sys.stdout.write(" ")
-          sys.stdout.write("{0:.0f}%".format(float(self.progress) / self.maxProgress * 100))
-          sys.stdout.flush()
-          lastProgress = self.progress
+      self.tick()
       sleep(0.03)
-    sys.stdout.write("\r")
-    sys.stdout.write(self._msg)
-    sys.stdout.write(" Done.")
-    sys.stdout.flush()
-    print
+    self.finish()
 
 
 
@@ -70,22 +107,22 @@ class WaitIndicatorThread(Thread):
 
 def printInfoPairs(pairs):
   """Prints the info strings stored in a list of pairs, justified."""
-  maxLeftLen = 0
-  for p in pairs:
-    if len(p[0]) > maxLeftLen:
-      maxLeftLen = len(p[0])
+  fill = max([0] + [len(p[0]) for p in pairs]) + 5
+  out = []
   for p in pairs:
     if p[1]:
       if isinstance(p[1], list):
-        print "{0}:".format(p[0])
+        out.append("%s:" % p[0])
         for message in p[1]:
-          print "- {0}".format(message)
+          out.append("- %s" % message)
       else:
-        print "{0}{1}".format(p[0].ljust(maxLeftLen+5, "."), p[1])
+        out.append("%s%s" % (p[0].ljust(fill, "."), p[1]))
     else:
-      print
-      print p[0]
-  print
+      out.append("")
+      out.append(p[0])
+  out.append("")
+  sys.stdout.write("\n".join(out))
+  sys.stdout.write("\n")
 
 
 
@@ -94,13 +131,13 @@ def getGeneralInfo(fs):
   pairs = []
   if fs.fsType == "EXT2":
     pairs.append( ("GENERAL INFORMATION", None) )
-    pairs.append( ("Ext2 revision", "{0}".format(fs.revision)) )
+    pairs.append( ("Ext2 revision", str(fs.revision)) )
     pairs.append( ("Total space", "{0:.2f} MB ({1} bytes)".format(float(fs.totalSpace) / 1048576, fs.totalSpace)) )
     pairs.append( ("Used space", "{0:.2f} MB ({1} bytes)".format(float(fs.usedSpace) / 1048576, fs.usedSpace)) )
     pairs.append( ("Total space for files", "{0:.2f} MB ({1} bytes)".format(float(fs.totalFileSpace) / 1048576, fs.totalFileSpace)) )
     pairs.append( ("Block size", "{0} bytes".format(fs.blockSize)) )
-    pairs.append( ("Num inodes", "{0}".format(fs.numInodes)) )
-    pairs.append( ("Num block groups", "{0}".format(fs.numBlockGroups)) )
+    pairs.append( ("Num inodes", str(fs.numInodes)) )
+    pairs.append( ("Num block groups", str(fs.numBlockGroups)) )
     
   else:
     raise FilesystemNotSupportedError()
@@ -109,35 +146,67 @@ def getGeneralInfo(fs):
 
 
 
+def _reportWorker(fs, methodName, conn):
+  """Runs the named report method of the filesystem and sends whether it succeeded along
+  with the report or the raised exception through the specified connection."""
+  try:
+    result = (True, getattr(fs, methodName)())
+  except Exception as e:
+    result = (False, e)
+  conn.send(result)
+  conn.close()
+
+
+
+def generateReport(fs, methodName, msg):
+  """Generates a report by running the named method of the filesystem in a worker process
+  while the wait indicator is shown with the given message, and returns the report. The
+  indicator is drawn from the main thread, so no other thread is running when the worker is
+  forked."""
+  receiver, sender = Pipe(False)
+  worker = Process(target=_reportWorker, args=(fs, methodName, sender))
+  wait = WaitIndicatorThread(msg)
+  worker.start()
+  sender.close()
+  try:
+    while not receiver.poll(0.03):
+      wait.tick()
+    succeeded, result = receiver.recv()
+  except EOFError:
+    raise FilesystemError("The report could not be generated.")
+  finally:
+    worker.join()
+    wait.finish()
+  
+  if not succeeded:
+    raise result
+  return result
+
+
+
 def generateDetailedInfo(fs, showWaitIndicator = True):
   """Scans the filesystem to gather detailed information about space usage and returns
   a list of information pairs."""
   if fs.fsType == "EXT2":
     if showWaitIndicator:
-      wait = WaitIndicatorThread("Scanning filesystem...")
-      wait.start()
-      try:
-        report = fs.scanBlockGroups()
-      finally:
-        wait.done = True
-      wait.join()
+      report = generateReport(fs, "scanBlockGroups", "Scanning filesystem...")
     else:
       report = fs.scanBlockGroups()
     
     pairs = []
     pairs.append( ("DETAILED STORAGE INFORMATION", None) )
-    pairs.append( ("Num regular files", "{0}".format(report.numRegFiles)) )
-    pairs.append( ("Num directories", "{0}".format(report.numDirs)) )
-    pairs.append( ("Num symlinks", "{0}".format(report.numSymlinks)) )
+    pairs.append( ("Num regular files", str(report.numRegFiles)) )
+    pairs.append( ("Num directories", str(report.numDirs)) )
+    pairs.append( ("Num symlinks", str(report.numSymlinks)) )
     for i,groupReport in enumerate(report.groupReports):
       groupInfo = []
-      groupInfo.append("Block bitmap location: {0}".format(groupReport.blockBitmapLocation))
-      groupInfo.append("Inode bitmap location: {0}".format(groupReport.inodeBitmapLocation))
-      groupInfo.append("Inode table location: {0}".format(groupReport.inodeTableLocation))
-      groupInfo.append("Free inodes: {0}".format(groupReport.numFreeInodes))
-      groupInfo.append("Free blocks: {0}".format(groupReport.numFreeBlocks))
-      groupInfo.append("Directory inodes: {0}".format(groupReport.numInodesAsDirs))
-      pairs.append( ("Block group {0}".format(i), groupInfo) )
+      groupInfo.append("Block bitmap location: %d" % groupReport.blockBitmapLocation)
+      groupInfo.append("Inode bitmap location: %d" % groupReport.inodeBitmapLocation)
+      groupInfo.append("Inode table location: %d" % groupReport.inodeTableLocation)
+      groupInfo.append("Free inodes: %d" % groupReport.numFreeInodes)
+      groupInfo.append("Free blocks: %d" % groupReport.numFreeBlocks)
+      groupInfo.append("Directory inodes: %d" % groupReport.numInodesAsDirs)
+      pairs.append( ("Block group %d" % i, groupInfo) )
     
   else:
     raise FilesystemNotSupportedError()
@@ -151,20 +220,14 @@ def generateIntegrityReport(fs, showWaitIndicator = True):
   information pairs."""
   if fs.fsType == "EXT2":
     if showWaitIndicator:
-      wait = WaitIndicatorThread("Checking filesystem integrity...")
-      wait.start()
-      try:
-        report = fs.checkIntegrity()
-      finally:
-        wait.done = True
-      wait.join()
+      report = generateReport(fs, "checkIntegrity", "Checking filesystem integrity...")
     else:
       report = fs.checkIntegrity()
     
     pairs = []
     pairs.append( ("INTEGRITY REPORT", None) )
-    pairs.append( ("Contains magic number", "{0}".format(report.hasMagicNumber)) )
-    pairs.append( ("Num superblock copies", "{0}".format(report.numSuperblockCopies)) )
+    pairs.append( ("Contains magic number", str(report.hasMagicNumber)) )
+    pairs.append( ("Num superblock copies", str(report.numSuperblockCopies)) )
     pairs.append( ("Superblock copy locations", "Block groups {0}".format(",".join(map(str,report.copyLocations)))) )
     pairs.append( ("Report messages", list(report.messages)) )
     
@@ -184,44 +247,48 @@ def printShellHelp():
   """Prints a help screen for the shell, listing supported commands."""
   sp = 26
   rsp = 4
-  print "Supported commands:"
-  print "{0}{1}".format("pwd".ljust(sp), "Prints the current working directory.")
-  print "{0}{1}".format("ls [-aFilRuU] [directory]".ljust(sp), "Prints the entries in the specified directory, or")
-  print "{0}{1}".format("".ljust(sp), "the working directory if none is specified.")
-  print "{0}{1}".format("".ljust(sp), "Optional flags:")
-  print "{0}{1}{2}".format("".ljust(sp), "-a".ljust(rsp), "Lists hidden entries.")
-  print "{0}{1}{2}".format("".ljust(sp), "-F".ljust(rsp), "Display character after each entry")
-  print "{0}{1}{2}".format("".ljust(sp), "".ljust(rsp), "showing its type.")
-  print "{0}{1}{2}".format("".ljust(sp), "-i".ljust(rsp), "Show each entry's inode number.")
-  print "{0}{1}{2}".format("".ljust(sp), "-l".ljust(rsp), "Long list format.")
-  print "{0}{1}{2}".format("".ljust(sp), "-R".ljust(rsp), "Lists entries recursively.")
-  print "{0}{1}{2}".format("".ljust(sp), "-u".ljust(rsp), "Show last access time in long list format.")
-  print "{0}{1}{2}".format("".ljust(sp), "-U".ljust(rsp), "Show creation time in long list format.")
-  print
-  print "{0}{1}".format("cd directory".ljust(sp), "Changes to the specified directory.")
-  print
-  print "{0}{1}".format("mkdir name".ljust(sp), "Makes a new directory with the specified name")
-  print
-  print "{0}{1}".format("rm [-r] filename".ljust(sp), "Removes the specified file or directory. The optional")
-  print "{0}{1}".format("".ljust(sp), "-r flag forces recursive deletion of directories.")
-  print
-  print "{0}{1}".format("mv source dest".ljust(sp), "Moves the specified source file or directory to")
-  print "{0}{1}".format("".ljust(sp), "the destination file or directory.")
-  print
-  print "{0}{1}".format("cp source dest".ljust(sp), "Copies the specified source file or directory to")
-  print "{0}{1}".format("".ljust(sp), "the destination file or directory.")
-  print
-  print "{0}{1}".format("ln [-s] source name".ljust(sp), "Creates a link to the source with the specified ")
-  print "{0}{1}".format("".ljust(sp), "name. If -s is specified, the new link is")
-  print "{0}{1}".format("".ljust(sp), "symbolic. Hard links require source to exist.")
-  print
-  print "{0}{1}".format("chown uid filename".ljust(sp), "Changes the owner uid of the file to the given uid.")
-  print "{0}{1}".format("chgrp gid filename".ljust(sp), "Changes the owner gid of the file to the given gid.")
-  print "{0}{1}".format("chmod octmode filename".ljust(sp), "Changes the mode of the file to the one specified.")
-  print
-  print "{0}{1}".format("help".ljust(sp), "Prints this message.")
-  print "{0}{1}".format("exit".ljust(sp), "Exits shell mode.")
-  print
+  print("Supported commands:")
+  print("{0}{1}".format("pwd".ljust(sp), "Prints the current working directory."))
+  print("{0}{1}".format("ls [-aFilRuU] [directory]".ljust(sp), "Prints the entries in the specified directory, or"))
+  print("{0}{1}".format("".ljust(sp), "the working directory if none is specified."))
+  print("{0}{1}".format("".ljust(sp), "Optional flags:"))
+  print("{0}{1}{2}".format("".ljust(sp), "-a".ljust(rsp), "Lists hidden entries."))
+  print("{0}{1}{2}".format("".ljust(sp), "-F".ljust(rsp), "Display character after each entry"))
+  print("{0}{1}{2}".format("".ljust(sp), "".ljust(rsp), "showing its type."))
+  print("{0}{1}{2}".format("".ljust(sp), "-i".ljust(rsp), "Show each entry's inode number."))
+  print("{0}{1}{2}".format("".ljust(sp), "-l".ljust(rsp), "Long list format."))
+  print("{0}{1}{2}".format("".ljust(sp), "-R".ljust(rsp), "Lists entries recursively."))
+  print("{0}{1}{2}".format("".ljust(sp), "-u".ljust(rsp), "Show last access time in long list format."))
+  print("{0}{1}{2}".format("".ljust(sp), "-U".ljust(rsp), "Show creation time in long list format."))
+  print()
+  print("{0}{1}".format("cd directory".ljust(sp), "Changes to the specified directory."))
+  print()
+  print("{0}{1}".format("mkdir name".ljust(sp), "Makes a new directory with the specified name"))
+  print()
+  print("{0}{1}".format("rm [-r] filename".ljust(sp), "Removes the specified file or directory. The optional"))
+  print("{0}{1}".format("".ljust(sp), "-r flag forces recursive deletion of directories."))
+  print()
+  print("{0}{1}".format("mv source dest".ljust(sp), "Moves the specified source file or directory to"))
+  print("{0}{1}".format("".ljust(sp), "the destination file or directory."))
+  print()
+  print("{0}{1}".format("cp source dest".ljust(sp), "Copies the specified source file or directory to"))
+  print("{0}{1}".format("".ljust(sp), "the destination file or directory."))
+  print()
+  print("{0}{1}".format("ln [-s] source name".ljust(sp), "Creates a link to the source with the specified "))
+  print("{0}{1}".format("".ljust(sp), "name. If -s is specified, the new link is"))
+  print("{0}{1}".format("".ljust(sp), "symbolic. Hard links require source to exist."))
+  print()
+  print("{0}{1}".format("chown uid filename".ljust(sp), "Changes the owner uid of the file to the given uid."))
+  print("{0}{1}".format("chgrp gid filename".ljust(sp), "Changes the owner gid of the file to the given gid."))
+  print("{0}{1}".format("chmod octmode filename".ljust(sp), "Changes the mode of the file to the one specified."))
+  print()
+  print("{0}{1}".format("help".ljust(sp), "Prints this message."))
+  print("{0}{1}".format("exit".ljust(sp), "Exits shell mode."))
+  print()
+  print("Paths are looked up in a copy of the directory tree read when the shell starts. The copy")
+  print("is dropped by the first mkdir, rm, mv, cp, ln, chown, chgrp or chmod, after which paths")
+  print("are looked up by walking the directories.")
+  print()
 
 
 def printDirectory(directory, recursive, showAll, longList, showTypeCharacters, showInodeNums, useTimeAccess, useTimeCreation):
@@ -229,15 +296,20 @@ def printDirectory(directory, recursive, showAll, longList, showTypeCharacters,
   if not directory.fsType == "EXT2":
     raise FilesystemNotSupportedError()
   
-  q = deque([])
-  q.append(directory)
-  while len(q) > 0:
-    d = q.popleft()
+  if useTimeAccess:
+    timeField = "timeAccessed"
+  elif useTimeCreation:
+    timeField = "timeCreated"
+  else:
+    timeField = "timeModified"
+  getRowFields = attrgetter("inodeNum", "modeStr", "numLinks", "uid", "gid", "size", timeField)
+  
+  q = [directory]
+  head = 0
+  while head < len(q):
+    d = q[head]
+    head += 1
     files = []
-    maxInodeLen = 0
-    maxSizeLen = 0
-    maxUidLen = 0
-    maxGidLen = 0
     for f in d.files():
       if not showAll and f.name.startswith("."):
         continue
@@ -245,81 +317,80 @@ def printDirectory(directory, recursive, showAll, longList, showTypeCharacters,
         if recursive:
           q.append(f)
       files.append(f)
-      if longList:
-        maxInodeLen = max(len(str(f.inodeNum)), maxInodeLen)
-        maxSizeLen = max(len(str(f.size)), maxSizeLen)
-        maxUidLen = max(len(str(f.uid)), maxUidLen)
-        maxGidLen = max(len(str(f.gid)), maxGidLen)
     
-    files = sorted(files, key=lambda f: f.name)
+    files.sort(key=attrgetter("name"))
     
+    lines = []
     if recursive:
-      print "{0}:".format(d.absolutePath)
+      lines.append("%s:" % d.absolutePath)
     
+    names = []
     for f in files:
+      name = f.name
+      if showTypeCharacters:
+        if f.isDir:
+          name = "%s/" % name
+        elif f.isSymlink:
+          name = "%s@" % name
+        elif f.isRegular and f.isExecutable:
+          name = "%s*" % name
+      if longList and f.isSymlink:
+        name = "%s -> %s" % (name, f.getLinkedPath())
+      names.append(name)
+    
+    if not longList:
+      lines.extend(names)
+    
+    elif len(files) > 0:
+      # gather each field of the listing into its own column, reading it only once per file
+      inodeNums, modeStrs, numLinks, uids, gids, sizes, timeStrs = zip(*map(getRowFields, files))
+      maxInodeLen = max(map(len, map(str, inodeNums)))
+      maxSizeLen = max(map(len, map(str, sizes)))
+      maxUidLen = max(map(len, map(str, uids)))
+      maxGidLen = max(map(len, map(str, gids)))
       
-      if not longList:
-        name = f.name
-        if showTypeCharacters:
-          if f.isDir:
-            name = "{0}/".format(name)
-          elif f.isSymlink:
-            name = "{0}@".format(name)
-          elif f.isRegular and f.isExecutable:
-            name = "{0}*".format(name)
-        print name
-        
-      else:
+      for i in range(len(files)):
         inodeStr = ""
-        name = f.name
-        if showTypeCharacters:
-          if f.isDir:
-            name = "{0}/".format(name)
-          elif f.isSymlink:
-            name = "{0}@".format(name)
-          elif f.isRegular and f.isExecutable:
-            name = "{0}*".format(name)
-        
-        if f.isSymlink:
-          name = "{0} -> {1}".format(name, f.getLinkedPath())
-      
-        
         if showInodeNums:
-          inodeStr = "{0} ".format(f.inodeNum).rjust(maxInodeLen + 1)
-
-        numLinks = "{0}".format(f.numLinks).rjust(2)
-        uid = "{0}".format(f.uid).rjust(maxUidLen)
-        gid = "{0}".format(f.gid).rjust(maxGidLen)
-        size = "{0}".format(f.size).rjust(maxSizeLen)
-        if useTimeAccess:
-          time = f.timeAccessed.ljust(17)
-        elif useTimeCreation:
-          time = f.timeCreated.ljust(17)
-        else:
-          time = f.timeModified.ljust(17)
+          inodeStr = "%*d " % (maxInodeLen, inodeNums[i])
+        lines.append(LONG_LIST_FORMAT % (inodeStr, modeStrs[i], numLinks[i], maxUidLen, uids[i],
+                                         maxGidLen, gids[i], maxSizeLen, sizes[i], timeStrs[i], names[i]))
+    
+    # emit each directory listing, followed by a blank line, in a single write
+    lines.append("")
+    lines.append("")
+    sys.stdout.write("\n".join(lines))
+
 
-        print "{0}{1} {2} {3} {4} {5} {6} {7}".format(inodeStr, f.modeStr, numLinks, uid, gid, size, time, name)
-    print
 
 
+def walkPostOrder(directory):
+  """Generates (parent directory, file) pairs for every file below the specified directory,
+  with the contents of each directory generated before the directory itself."""
+  # the entries of each directory are listed up front so that files can be removed from it
+  # while the walk is in progress
+  stack = [(None, directory, iter(list(directory.files())))]
+  while len(stack) > 0:
+    parent, d, it = stack[-1]
+    for f in it:
+      if f.name == "." or f.name == "..":
+        continue
+      if f.isDir:
+        stack.append((d, f, iter(list(f.files()))))
+        break
+      yield (d, f)
+    else:
+      stack.pop()
+      if not parent is None:
+        yield (parent, d)
+
 
 
 def removeFile(parentDir, rmFile, recursive = False):
   """Removes the specified file or directory from the given directory."""
   
   if recursive and rmFile.isDir:
-    
-    def getFilesToRemove(rmDir):
-      filesToRemove = deque([])
-      for f in rmDir.files():
-        if f.name == "." or f.name == "..":
-          continue
-        if f.isDir:
-          filesToRemove.extend(getFilesToRemove(f))
-        filesToRemove.append((rmDir, f))
-      return filesToRemove
-    
-    for parent,f in getFilesToRemove(rmFile):
+    for parent, f in walkPostOrder(rmFile):
       parent.removeFile(f)
   
   parentDir.removeFile(rmFile)
@@ -373,7 +444,7 @@ def copyFile(fromFile, toDir, newFilename = None, showWaitIndicator = True):
     mbps = float(written) / (1024*1024) / transferTime
   else:
     mbps = 0
-  print "Copied {0} bytes at {1:.2f} MB/sec.".format(written, mbps)
+  print("Copied {0} bytes at {1:.2f} MB/sec.".format(written, mbps))
   
 
 
@@ -397,7 +468,7 @@ def getFileObject(fs, directory, path, followSymlinks):
     else:
       fileObject = directory.getFileAt(path, followSymlinks)
   except FileNotFoundError:
-    raise FilesystemError("{0} does not exist.".format(path))
+    raise FileNotFoundError("{0} does not exist.".format(path))
   if fileObject.absolutePath == directory.absolutePath:
     fileObject = directory
   return fileObject
@@ -420,10 +491,205 @@ def parseNewPath(fs, directory, path):
   return (parentDir, name)
 
 
+class ShellState(object):
+  """Holds state kept by the shell between commands: the filesystem, the working directory,
+  and file objects looked up by path. Cached file objects, and the errors raised for paths
+  that could not be found, are kept in least-recently-used order until the cache is
+  invalidated by a command that changes the filesystem."""
+  maxCachedPaths = 512
+  
+  def __init__(self, fs):
+    self.fs = fs
+    self.workingDir = fs.rootDir
+    self._pathCache = OrderedDict()
+  
+  def resolve(self, directory, path, followSymlinks):
+    """Looks up the file object specified by the given absolute path or the path relative to
+    the specified directory, consulting the cache first."""
+    key = (posixpath.join(directory.absolutePath, path), followSymlinks)
+    fileObject = self._pathCache.pop(key, None)
+    if fileObject is None:
+      try:
+        fileObject = getFileObject(self.fs, directory, path, followSymlinks)
+      except FileNotFoundError as e:
+        fileObject = e.with_traceback(None)
+      if len(self._pathCache) >= self.maxCachedPaths:
+        self._pathCache.popitem(False)
+    self._pathCache[key] = fileObject
+    
+    if isinstance(fileObject, FileNotFoundError):
+      raise fileObject.with_traceback(None)
+    if fileObject.absolutePath == directory.absolutePath:
+      fileObject = directory
+    return fileObject
+  
+  def invalidate(self):
+    """Forgets all cached lookups, including the filesystem's preloaded tree."""
+    self._pathCache.clear()
+    self.fs.clearPreloadedTree()
+
+
+def _shellHelp(state, flags, parameters):
+  """Prints the shell help."""
+  printShellHelp()
+
+
+def _shellPwd(state, flags, parameters):
+  """Prints the working directory."""
+  print(state.workingDir.absolutePath)
+
+
+def _shellLs(state, flags, parameters):
+  """Lists the working directory or the specified directory."""
+  if len(parameters) == 0:
+    lsDir = state.workingDir
+  elif len(parameters) == 1:
+    lsDir = state.resolve(state.workingDir, parameters[0], True)
+  else:
+    raise ShellError("Invalid parameters.")
+  printDirectory(lsDir, "R" in flags, "a" in flags, "l" in flags, "F" in flags,
+                 "i" in flags, "u" in flags, "U" in flags)
+
+
+def _shellCd(state, flags, parameters):
+  """Changes the working directory."""
+  if len(parameters) != 1:
+    raise ShellError("Invalid parameters.")
+  cdDir = state.resolve(state.workingDir, parameters[0], True)
+  if not cdDir.isDir:
+    raise FilesystemError("Not a directory.")
+  state.workingDir = cdDir
+
+
+def _shellMkdir(state, flags, parameters):
+  """Makes a new directory."""
+  if len(parameters) != 1:
+    raise ShellError("Invalid parameters.")
+  parentDir, name = parseNewPath(state.fs, state.workingDir, parameters[0])
+  parentDir.makeDirectory(name)
+
+
+def _shellRm(state, flags, parameters):
+  """Removes a file, or a directory tree with the r flag."""
+  if len(parameters) != 1:
+    raise ShellError("Invalid parameters.")
+  parentDir, name = parseNewPath(state.fs, state.workingDir, parameters[0])
+  rmFile = parentDir.getFileAt(name, False)
+  removeFile(parentDir, rmFile, "r" in flags)
+
+
+def _shellMoveOrCopy(transfer):
+  """Returns a handler that moves or copies a file using the specified transfer function."""
+  def __handler(state, flags, parameters):
+    if len(parameters) != 2:
+      raise ShellError("Invalid parameters.")
+    fs = state.fs
+    parentDir, name = parseNewPath(fs, state.workingDir, parameters[0])
+    fromFile = parentDir.getFileAt(name, False)
+    toDir, name = parseNewPath(fs, state.workingDir, parameters[1])
+    
+    try:
+      nextDir = toDir.getFileAt(name)
+      if nextDir.isSymlink:
+        try:
+          while nextDir.isSymlink:
+            nextDir = fs.rootDir.getFileAt(nextDir.getLinkedPath()[1:])
+        except FileNotFoundError:
+          pass
+      if nextDir.isDir:
+        toDir = nextDir
+        name = ""
+    except FileNotFoundError:
+      pass
+    
+    if len(name) == 0:
+      name = None
+    transfer(fromFile, toDir, name)
+  return __handler
+
+
+def _shellLn(state, flags, parameters):
+  """Makes a hard link, or a symbolic link with the s flag."""
+  if len(parameters) != 2:
+    raise ShellError("Invalid parameters.")
+  destDir, name = parseNewPath(state.fs, state.workingDir, parameters[1])
+  if len(name) == 0:
+    raise ShellError("No name specified.")
+  if "s" in flags:
+    destDir.makeSymbolicLink(name, parameters[0])
+  else:
+    parentDir, name = parseNewPath(state.fs, state.workingDir, parameters[0])
+    sourceFile = parentDir.getFileAt(name, False)
+    destDir.makeHardLink(name, sourceFile)
+
+
+def _shellChown(state, flags, parameters):
+  """Changes the owner of a file."""
+  if len(parameters) != 2:
+    raise ShellError("Invalid parameters.")
+  uid = int(parameters[0])
+  name = parameters[1]
+  if len(name) == 0:
+    raise ShellError("No filename specified.")
+  chFile = state.resolve(state.workingDir, name, True)
+  chFile.uid = uid
+
+
+def _shellChgrp(state, flags, parameters):
+  """Changes the group of a file."""
+  if len(parameters) != 2:
+    raise ShellError("Invalid parameters.")
+  gid = int(parameters[0])
+  name = parameters[1]
+  if len(name) == 0:
+    raise ShellError("No filename specified.")
+  chFile = state.resolve(state.workingDir, name, True)
+  chFile.gid = gid
+
+
+def _shellChmod(state, flags, parameters):
+  """Changes the permissions of a file."""
+  if len(parameters) != 2:
+    raise ShellError("Invalid parameters.")
+  octmode = parameters[0]
+  try:
+    mode = (int(octmode[0]) & 0x7) << 6
+    mode |= (int(octmode[1]) & 0x7) << 3
+    mode |= (int(octmode[2]) & 0x7)
+  except:
+    raise ShellError("Invalid mode specified.")
+  name = parameters[1]
+  if len(name) == 0:
+    raise ShellError("No filename specified.")
+  chFile = state.resolve(state.workingDir, name, True)
+  chFile.permissions = mode
+
+
+# maps each shell command to its handler, which is called with the shell state, the set of
+# flag characters given and the list of parameters
+SHELL_COMMANDS = {
+  "help": _shellHelp,
+  "pwd": _shellPwd,
+  "ls": _shellLs,
+  "cd": _shellCd,
+  "mkdir": _shellMkdir,
+  "rm": _shellRm,
+  "mv": _shellMoveOrCopy(moveFile),
+  "cp": _shellMoveOrCopy(copyFile),
+  "ln": _shellLn,
+  "chown": _shellChown,
+  "chgrp": _shellChgrp,
+  "chmod": _shellChmod,
+}
+
+# shell commands after which cached file objects may be stale
+MODIFYING_SHELL_COMMANDS = frozenset(["mkdir", "rm", "mv", "cp", "ln", "chown", "chgrp", "chmod"])
+
+
 def shell(fs):
   """Enters a command-line shell with commands for operating on the specified filesystem."""
-  workingDir = fs.rootDir
-  print "Entered shell mode. Type 'help' for shell commands."
+  state = ShellState(fs)
+  print("Entered shell mode. Type 'help' for shell commands.")
   
   
   def __parseInput(inputline):
@@ -434,7 +700,7 @@ def shell(fs):
     if len(parts) == 0:
       raise ShellError("No command specified.")
     cmd = parts.popleft()
-    flags = []
+    flags = set()
     parameters = []
     
     while len(parts) > 0:
@@ -444,27 +710,28 @@ def shell(fs):
         raise ShellError("Invalid escape sequence.")
       
       if part.startswith("-") and len(parameters) == 0:
-        flags.extend(list(part[1:]))
+        flags.update(part[1:])
       
       elif part.startswith("\"") or part.startswith("\'"):
         quoteChar = part[0]
-        param = part[1:]
+        pieces = [part[1:]]
         nextPart = part
         while not nextPart.endswith(quoteChar) and len(parts) > 0:
           nextPart = parts.popleft()
-          param = "{0} {1}".format(param, nextPart)
+          pieces.append(nextPart)
+        param = " ".join(pieces)
         if not param.endswith(quoteChar):
           raise ShellError("No closing quotation found.")
         parameters.append(param[:-1])
       
       elif part.endswith("\\"):
-        param = ""
+        pieces = []
         nextPart = part
         while nextPart.endswith("\\") and len(parts) > 0:
-          param = "{0} {1}".format(param, nextPart[:-1])
+          pieces.append(nextPart[:-1])
           nextPart = parts.popleft()
-        param = "{0} {1}".format(param, nextPart)
-        parameters.append(param.strip())
+        pieces.append(nextPart)
+        parameters.append(" ".join(pieces).strip())
       
       else:
         parameters.append(part)
@@ -473,164 +740,30 @@ def shell(fs):
   
   
   while True:
-    inputline = raw_input(": '{0}' >> ".format(workingDir.absolutePath)).rstrip()
+    inputline = input(": '{0}' >> ".format(state.workingDir.absolutePath)).rstrip()
     if len(inputline) == 0:
       continue
     
     try:
-      parsed = __parseInput(inputline)
-      cmd = parsed[0]
-      flags = parsed[1]
-      parameters = parsed[2]
-      
-      if cmd == "help":
-        printShellHelp()
-        
-      elif cmd == "exit":
+      cmd, flags, parameters = __parseInput(inputline)
+      if cmd == "exit":
         break
-        
-      elif cmd == "pwd":
-        print workingDir.absolutePath
-      
-      elif cmd == "ls":
-        if len(parameters) == 0:
-          printDirectory(workingDir, "R" in flags, "a" in flags, "l" in flags, "F" in flags,
-                         "i" in flags, "u" in flags, "U" in flags)
-        elif len(parameters) == 1:
-          lsDir = getFileObject(fs, workingDir, parameters[0], True)
-          printDirectory(lsDir, "R" in flags, "a" in flags, "l" in flags, "F" in flags,
-                         "i" in flags, "u" in flags, "U" in flags)
-        else:
-          raise ShellError("Invalid parameters.")
-        
-      elif cmd == "cd":
-        if len(parameters) != 1:
-          raise ShellError("Invalid parameters.")
-        cdDir = getFileObject(fs, workingDir, parameters[0], True)
-        if not cdDir.isDir:
-          raise FilesystemError("Not a directory.")
-        workingDir = cdDir
-      
-      
-      elif cmd == "mkdir":
-        if len(parameters) != 1:
-          raise ShellError("Invalid parameters.")
-        parsed = parseNewPath(fs, workingDir, parameters[0])
-        parentDir = parsed[0]
-        name = parsed[1]
-        parentDir.makeDirectory(name)
-  
-          
-      elif cmd == "rm":
-        if len(parameters) != 1:
-          raise ShellError("Invalid parameters.")
-        parsed = parseNewPath(fs, workingDir, parameters[0])
-        parentDir = parsed[0]
-        name = parsed[1]
-        rmFile = parentDir.getFileAt(name, False)
-        removeFile(parentDir, rmFile, "r" in flags)
-        
-        
-      elif cmd == "mv" or cmd == "cp":
-        if len(parameters) != 2:
-          raise ShellError("Invalid parameters.")
-        parsed = parseNewPath(fs, workingDir, parameters[0])
-        parentDir = parsed[0]
-        name = parsed[1]
-        fromFile = parentDir.getFileAt(name, False)
-        parsed = parseNewPath(fs, workingDir, parameters[1])
-        toDir = parsed[0]
-        name = parsed[1]
-        
-        try:
-          nextDir = toDir.getFileAt(name)
-          if nextDir.isSymlink:
-            try:
-              while nextDir.isSymlink:
-                nextDir = fs.rootDir.getFileAt(nextDir.getLinkedPath()[1:])
-            except FileNotFoundError:
-              pass
-          if nextDir.isDir:
-            toDir = nextDir
-            name = ""
-        except FileNotFoundError:
-          pass
-        
-        if len(name) == 0:
-          name = None
-        if cmd == "mv":
-          moveFile(fromFile, toDir, name)
-        elif cmd == "cp":
-          copyFile(fromFile, toDir, name)
-      
-  
-      elif cmd == "ln":
-        if len(parameters) != 2:
-          raise ShellError("Invalid parameters.")
-        parsed = parseNewPath(fs, workingDir, parameters[1])
-        destDir = parsed[0]
-        name = parsed[1]
-        if len(name) == 0:
-          raise ShellError("No name specified.")
-        if "s" in flags:
-          destDir.makeSymbolicLink(name, parameters[0])
-        else:
-          parsed = parseNewPath(fs, workingDir, parameters[0])
-          parentDir = parsed[0]
-          name = parsed[1]
-          sourceFile = parentDir.getFileAt(name, False)
-          destDir.makeHardLink(name, sourceFile)
-
-
-      elif cmd == "chown":
-        if len(parameters) != 2:
-          raise ShellError("Invalid parameters.")
-        uid = int(parameters[0])
-        name = parameters[1]
-        if len(name) == 0:
-          raise ShellError("No filename specified.")
-        chFile = getFileObject(fs, workingDir, name, True)
-        chFile.uid = uid
-
-
-      elif cmd == "chgrp":
-        if len(parameters) != 2:
-          raise ShellError("Invalid parameters.")
-        gid = int(parameters[0])
-        name = parameters[1]
-        if len(name) == 0:
-          raise ShellError("No filename specified.")
-        chFile = getFileObject(fs, workingDir, name, True)
-        chFile.gid = gid
-
-
-      elif cmd == "chmod":
-        if len(parameters) != 2:
-          raise ShellError("Invalid parameters.")
-        octmode = parameters[0]
-        try:
-          mode = (int(octmode[0]) & 0x7) << 6
-          mode |= (int(octmode[1]) & 0x7) << 3
-          mode |= (int(octmode[2]) & 0x7)
-        except:
-          raise ShellError("Invalid mode specified.")
-        name = parameters[1]
-        if len(name) == 0:
-          raise ShellError("No filename specified.")
-        chFile = getFileObject(fs, workingDir, name, True)
-        chFile.permissions = mode
-        
       
-      else:
+      handler = SHELL_COMMANDS.get(cmd)
+      if handler is None:
         raise ShellError("Command not recognized.")
+      if cmd in MODIFYING_SHELL_COMMANDS:
+        state.invalidate()
+      handler(state, flags, parameters)
+      
     except ShellError as e:
-      print e
+      print(e)
       continue
-    except FileNotFoundError:
-      print "File not found."
+    except FileNotFoundError as e:
+      print(str(e) or "File not found.")
       continue
     except FilesystemError as e:
-      print e
+      print(e)
       continue
 
   
@@ -639,6 +772,64 @@ def shell(fs):
 
 # ========= FILE TRANSFER ==============================================
 
+def _fetchOne(srcFile, destDirectory, wait = None, lock = None):
+  """Copies the specified regular file from the filesystem image into the local destination
+  directory, returning the number of bytes read and the time taken. If a lock is given,
+  progress updates to the wait indicator are made while holding it."""
+  srcPath = "{0}/{1}".format(destDirectory, srcFile.name)
+  try:
+    outFd = os.open(srcPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+  except:
+    raise FilesystemError("Cannot access specified destination directory.")
+  
+  def __flush(buf):
+    written = os.write(outFd, buf)
+    while written < len(buf):
+      written += os.write(outFd, buf[written:])
+    if wait:
+      if lock:
+        with lock:
+          wait.progress += written
+      else:
+        wait.progress += written
+    del buf[:]
+    return written
+  
+  transferStart = clock()
+  readCount = 0
+  buf = bytearray()
+  try:
+    for block in srcFile.blocks():
+      buf += block
+      if len(buf) >= FETCH_CHUNK_SIZE:
+        readCount += __flush(buf)
+    if len(buf) > 0:
+      readCount += __flush(buf)
+  finally:
+    os.close(outFd)
+  transferTime = clock() - transferStart
+  
+  os.utime(srcPath, (srcFile.timeAccessedEpoch, srcFile.timeModifiedEpoch))
+  return (readCount, transferTime)
+
+
+
+def _fetchAll(srcFiles, destDirectory, wait = None):
+  """Fetches the specified regular files into the local destination directory using a small
+  pool of worker threads. Returns a list of (bytes read, time taken) in the order given. If a
+  file cannot be fetched, files not yet started are skipped and the error is raised."""
+  lock = Lock()
+  with ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS) as executor:
+    futures = [executor.submit(_fetchOne, f, destDirectory, wait, lock) for f in srcFiles]
+    try:
+      return [future.result() for future in futures]
+    except:
+      for future in futures:
+        future.cancel()
+      raise
+
+
+
 def fetchFile(fs, srcFilename, destDirectory, showWaitIndicator = True):
   """Fetches the specified file from the filesystem image and places it in
   the local destination directory."""
@@ -651,67 +842,43 @@ def fetchFile(fs, srcFilename, destDirectory, showWaitIndicator = True):
     destDirectory = "{0}/{1}".format(destDirectory, directory.name)
     for f in directory.files():
       if f.isRegular:
-        filesToFetch.append(f.absolutePath)
+        filesToFetch.append(f)
   else:
-    filesToFetch.append(srcFilename)
-  
-  if len(filesToFetch) == 0:
-    raise FilesystemError("No files exist in the specified directory.")
-  
-  if not os.path.exists(destDirectory):
-    print "Making directory {0}".format(destDirectory)
-    os.makedirs(destDirectory)
-    
-  for srcFilename in filesToFetch:
     try:
       srcFile = fs.rootDir.getFileAt(srcFilename)
     except FileNotFoundError:
       raise FilesystemError("The source file cannot be found on the filesystem image.")
-    
     if not srcFile.isRegular:
       raise FilesystemError("The source path does not point to a regular file.")
-    
-    srcPath = "{0}/{1}".format(destDirectory, srcFile.name)
+    filesToFetch.append(srcFile)
+  
+  if len(filesToFetch) == 0:
+    raise FilesystemError("No files exist in the specified directory.")
+  
+  if not os.path.exists(destDirectory):
+    print("Making directory {0}".format(destDirectory))
+    os.makedirs(destDirectory)
+  
+  if showWaitIndicator:
+    wait = WaitIndicatorThread("Fetching {0}...".format(srcFilename))
+    wait.maxProgress = sum(f.size for f in filesToFetch)
+    wait.start()
     try:
-      outFile = open(srcPath, "wb")
-    except:
-      raise FilesystemError("Cannot access specified destination directory.")
-    
-    def __read(wait = None):
-      readCount = 0
-      with outFile:
-        for block in srcFile.blocks():
-          outFile.write(block)
-          readCount += len(block)
-          if wait:
-            wait.progress += len(block)
-      return readCount
-    
-    if showWaitIndicator:
-      wait = WaitIndicatorThread("Fetching {0}...".format(srcFilename))
-      wait.maxProgress = srcFile.size
-      wait.start()
-      try:
-        transferStart = clock()
-        readCount = __read(wait)
-        transferTime = clock() - transferStart
-      finally:
-        wait.done = True
-      wait.join()
-    else:
-      transferStart = clock()
-      readCount = __read()
-      transferTime = clock() - transferStart
-    
+      results = _fetchAll(filesToFetch, destDirectory, wait)
+    finally:
+      wait.done = True
+    wait.join()
+  else:
+    results = _fetchAll(filesToFetch, destDirectory)
+  
+  for readCount, transferTime in results:
     if transferTime > 0:
       mbps = float(readCount) / (1024*1024) / transferTime
     else:
       mbps = 0
-    print "Read {0} bytes at {1:.2f} MB/sec.".format(readCount, mbps)
+    print("Read {0} bytes at {1:.2f} MB/sec.".format(readCount, mbps))
     
-    os.utime(srcPath, (srcFile.timeAccessedEpoch, srcFile.timeModifiedEpoch))
-    
-  print
+  print()
 
 
 
@@ -723,38 +890,49 @@ def putFile(fs, srcFilename, destDirectory, showWaitIndicator = True):
   destFilename = srcFilename[srcFilename.rfind("/")+1:]
   directory = getFileObject(fs, fs.rootDir, destDirectory, False)
 
-  if not os.path.exists(srcFilename):
+  try:
+    st = os.stat(srcFilename)
+  except OSError:
     raise FilesystemError("Source file does not exist.")
   
-  if not os.path.isfile(srcFilename):
+  if not stat.S_ISREG(st.st_mode):
     raise FilesystemError("Source is not a file.")
   
-  uid = os.stat(srcFilename).st_uid
-  gid = os.stat(srcFilename).st_gid
-  modTime = int(os.stat(srcFilename).st_mtime)
-  accessTime = int(os.stat(srcFilename).st_atime)
-  try:
-    creationTime = int(os.stat(srcFilename).st_birthtime)
-  except AttributeError:
-    creationTime = modTime
+  uid = st.st_uid
+  gid = st.st_gid
+  modTime = int(st.st_mtime)
+  accessTime = int(st.st_atime)
+  creationTime = int(getattr(st, "st_birthtime", st.st_mtime))
   newFile = directory.makeRegularFile(destFilename, uid, gid, creationTime, modTime, accessTime)
+  fs.clearPreloadedTree()
 
   inFile = open(srcFilename, "rb")
   def __write(wait = None):
     written = 0
+    blockSize = fs.blockSize
     with inFile:
-      inFile.seek(0, 2)
-      length = inFile.tell()
+      length = os.fstat(inFile.fileno()).st_size
       if wait:
         wait.maxProgress = length
         wait.start()
-      inFile.seek(0)
-      while written < length:
-        byteString = inFile.read(fs.blockSize)
-        newFile.write(byteString)
-        written += len(byteString)
-        if wait:
-          wait.progress += len(byteString)
+      if length <= PUT_WHOLE_FILE_SIZE:
+        data = inFile.read()
+        for offset in range(0, len(data), blockSize):
+          byteString = data[offset:offset+blockSize]
+          newFile.write(byteString)
+          written += len(byteString)
+          if wait:
+            wait.progress += len(byteString)
+      else:
+        buf = bytearray(blockSize)
+        while True:
+          n = inFile.readinto(buf)
+          if not n:
+            break
+          newFile.write(bytes(buf[:n]))
+          written += n
+          if wait:
+            wait.progress += n
     return written
 
   if showWaitIndicator:
@@ -775,7 +953,7 @@ def putFile(fs, srcFilename, destDirectory, showWaitIndicator = True):
     mbps = float(written) / (1024*1024) / transferTime
   else:
     mbps = 0
-  print "Wrote {0} bytes at {1:.2f} MB/sec.".format(written, mbps)
+  print("Wrote {0} bytes at {1:.2f} MB/sec.".format(written, mbps))
 
   
 
@@ -786,32 +964,32 @@ def putFile(fs, srcFilename, destDirectory, showWaitIndicator = True):
 def printHelp():
   """Prints the help screen for the main application, with usage and command options."""
   sp = 26
-  print "Usage: {0} image_file options".format(sys.argv[0])
-  print
-  print "Options:"
-  print "{0}{1}".format("-s".ljust(sp), "Enters shell mode.")
-  print "{0}{1}".format("-h".ljust(sp), "Prints this message and exits.")
-  print "{0}{1}".format("-f filepath [hostdir]".ljust(sp), "Fetches the specified file from the filesystem")
-  print "{0}{1}".format("".ljust(sp), "into the optional host directory. If no directory")
-  print "{0}{1}".format("".ljust(sp), "is specified, defaults to the current directory.")
-  print
-  print "{0}{1}".format("-p hostfile destpath".ljust(sp), "Puts the specified host file into the specified")
-  print "{0}{1}".format("".ljust(sp), "directory on the filesystem.")
-  print
-  print "{0}{1}".format("-i".ljust(sp), "Prints general information about the filesystem.")
-  print "{0}{1}".format("-d".ljust(sp), "Scans the filesystem and prints detailed space")
-  print "{0}{1}".format("".ljust(sp), "usage information.")
-  print
-  print "{0}{1}".format("-c".ljust(sp), "Checks the filesystem's integrity and prints a")
-  print "{0}{1}".format("".ljust(sp), "detailed integrity report.")
-  print
-  print "{0}{1}".format("-n blockSize numBlocks".ljust(sp), "Creates the specified image file as a new ext2")
-  print "{0}{1}".format("".ljust(sp), "image with the specified parameters.")
-  print
-  print "{0}{1}".format("-w".ljust(sp), "Suppress the wait indicator that is typically")
-  print "{0}{1}".format("".ljust(sp), "shown for long operations. This is useful when")
-  print "{0}{1}".format("".ljust(sp), "redirecting the output of this program.")
-  print
+  print("Usage: {0} image_file options".format(sys.argv[0]))
+  print()
+  print("Options:")
+  print("{0}{1}".format("-s".ljust(sp), "Enters shell mode."))
+  print("{0}{1}".format("-h".ljust(sp), "Prints this message and exits."))
+  print("{0}{1}".format("-f filepath [hostdir]".ljust(sp), "Fetches the specified file from the filesystem"))
+  print("{0}{1}".format("".ljust(sp), "into the optional host directory. If no directory"))
+  print("{0}{1}".format("".ljust(sp), "is specified, defaults to the current directory."))
+  print()
+  print("{0}{1}".format("-p hostfile destpath".ljust(sp), "Puts the specified host file into the specified"))
+  print("{0}{1}".format("".ljust(sp), "directory on the filesystem."))
+  print()
+  print("{0}{1}".format("-i".ljust(sp), "Prints general information about the filesystem."))
+  print("{0}{1}".format("-d".ljust(sp), "Scans the filesystem and prints detailed space"))
+  print("{0}{1}".format("".ljust(sp), "usage information."))
+  print()
+  print("{0}{1}".format("-c".ljust(sp), "Checks the filesystem's integrity and prints a"))
+  print("{0}{1}".format("".ljust(sp), "detailed integrity report."))
+  print()
+  print("{0}{1}".format("-n blockSize numBlocks".ljust(sp), "Creates the specified image file as a new ext2"))
+  print("{0}{1}".format("".ljust(sp), "image with the specified parameters."))
+  print()
+  print("{0}{1}".format("-w".ljust(sp), "Suppress the wait indicator that is typically"))
+  print("{0}{1}".format("".ljust(sp), "shown for long operations. This is useful when"))
+  print("{0}{1}".format("".ljust(sp), "redirecting the output of this program."))
+  print()
 
 
 def run(args, fs):
@@ -839,25 +1017,29 @@ def run(args, fs):
       info.extend(generateIntegrityReport(fs, not suppressIndicator))
     if len(info) > 0:
       printInfoPairs(info)
+    
+    # shell and fetch lookups are served from the tree walked once here
+    if enterShell or fetch:
+      fs.preloadTree()
       
     if put:
       srcNameIndex = args.index("-p") + 1
       destNameIndex = srcNameIndex + 1
       if len(args) <= srcNameIndex:
-        print "Error! No source file specified."
+        print("Error! No source file specified.")
       elif len(args) <= destNameIndex:
-        print "Error! No destination directory specified."
+        print("Error! No destination directory specified.")
       else:
         try:
           putFile(fs, args[srcNameIndex], args[destNameIndex], not suppressIndicator)
         except FilesystemError as e:
-          print "Error! {0}".format(e)
+          print("Error! {0}".format(e))
     
     if fetch:
       srcNameIndex = args.index("-f") + 1
       destNameIndex = srcNameIndex + 1
       if len(args) <= srcNameIndex:
-        print "Error! No source file specified."
+        print("Error! No source file specified.")
       else:
         if len(args) <= destNameIndex:
           destDirectory = "."
@@ -868,7 +1050,7 @@ def run(args, fs):
         try:
           fetchFile(fs, args[srcNameIndex], destDirectory, not suppressIndicator)
         except FilesystemError as e:
-          print "Error! {0}".format(e)
+          print("Error! {0}".format(e))
     
     if enterShell:
       shell(fs)
@@ -897,15 +1079,15 @@ def main():
         imageFilename = filename
         blockSize = int(args[i+1])
         numBlocks = int(args[i+2])
-        print "Making new filesystem {0} with blocksize {1} and {2} blocks...".format(imageFilename, blockSize, numBlocks)
+        print("Making new filesystem {0} with blocksize {1} and {2} blocks...".format(imageFilename, blockSize, numBlocks))
         Ext2Filesystem.makeFromNewImageFile(filename, blockSize, numBlocks)
-        print "Done."
+        print("Done.")
       except ShellError as e:
-        print "Error! {0}".format(e)
-        print "Filesystem creation failed."
+        print("Error! {0}".format(e))
+        print("Filesystem creation failed.")
       except FilesystemError as e:
-        print "Error! {0}".format(e)
-        print "Filesystem creation failed."
+        print("Error! {0}".format(e))
+        print("Filesystem creation failed.")
     
     else:
       try:
@@ -913,8 +1095,9 @@ def main():
         with fs:
           run(args, fs)
       except IOError:
-        print "Could not read image file."
+        print("Could not read image file.")
 
 
 
-main()
+if __name__ == "__main__":
+  main()
@@ -7,14 +7,22 @@ __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
 import re
-from struct import pack, unpack_from
+from struct import pack, Struct
 from time import time
 from ..error import *
-from .file import Ext2File
+from .file import Ext2File, _encodeName
 from .symlink import Ext2Symlink
 from .regularfile import Ext2RegularFile
 
 
+# precompiled layouts of a directory entry header for each revision
+_ENTRY_HEADER_REV0 = Struct("<IHH")
+_ENTRY_HEADER_REV1 = Struct("<IHBB")
+
+# separator between the names in a lookup path, which may be repeated
+_PATH_SEPARATOR = re.compile(b"/+")
+
+
 def _openRootDirectory(fs):
   """Opens and returns the root directory of the specified filesystem."""
   return Ext2Directory._openEntry(None, fs)
@@ -27,15 +35,16 @@ class _EntryList(object):
     """Constructs a new directory entry list for the specified directory."""
     self._containingDir = containingDir
     self._entries = []
+    self._entriesByName = None
     prevEntry = None
-    for i in range(containingDir.numBlocks):
-      blockId = containingDir._inode.lookupBlockId(i)
-      if blockId == 0:
-        break
-      blockBytes = containingDir._fs._readBlock(blockId)
+    fs = containingDir._fs
+    blockSize = fs.blockSize
+    blockIds = containingDir._dataBlockIds()
+    for i, blockBytes in enumerate(fs._readBlocks(blockIds)):
+      blockId = blockIds[i]
       offset = 0
-      while offset < containingDir._fs.blockSize:
-        entry = _Entry(i, blockId, offset, prevEntry, blockBytes[offset:], containingDir)
+      while offset < blockSize:
+        entry = _Entry(i, blockId, offset, prevEntry, blockBytes, containingDir, offset)
         if entry.inodeNum == 0:
           break
         prevEntry = entry
@@ -44,24 +53,27 @@ class _EntryList(object):
   
   
   def __iter__(self):
-    """Gets the iterator to this list."""
-    self._itIndex = 0
-    return self
+    """Gets a new iterator over the entries in this list, so that the list may be walked by
+    several loops at once."""
+    return iter(self._entries)
   
   
-  def next(self):
-    """Gets the next entry in the linked list."""
-    if self._itIndex == len(self._entries):
-      raise StopIteration
-    entry = self._entries[self._itIndex]
-    self._itIndex += 1
-    return entry
+  def find(self, name):
+    """Gets the first entry with the specified name, or None if there is no such entry. The
+    entries are indexed by name the first time one is looked up."""
+    if self._entriesByName is None:
+      entriesByName = {}
+      for entry in self._entries:
+        entriesByName.setdefault(entry.name, entry)
+      self._entriesByName = entriesByName
+    return self._entriesByName.get(name)
   
   
   def append(self, name, inode):
     """Appends a new entry for the specified inode at the end of the list, and returns
     the entry object."""
     
+    name = _encodeName(name)
     nameLength = len(name)
     if nameLength > 255:
       raise FilesystemError("Name is too long.")
@@ -103,12 +115,15 @@ class _EntryList(object):
     newEntry.prevEntry = lastEntry
     lastEntry.nextEntry = newEntry
     self._entries.append(newEntry)
+    if not self._entriesByName is None:
+      self._entriesByName.setdefault(newEntry.name, newEntry)
     return newEntry
   
   
   def remove(self, entry):
     """Removes the specified directory from the entry list."""
     self._entries.remove(entry)
+    self._entriesByName = None
     entry.inodeNum = 0
     entry.prevEntry.nextEntry = entry.nextEntry
     if entry.nextEntry:
@@ -119,6 +134,9 @@ class _EntryList(object):
 class _Entry(object):
   """Represents a directory entry in a linked entry list on the Ext2 filesystem. For internal use only."""
 
+  __slots__ = ("_fileType", "_name", "_inodeNum", "_size", "_bindex", "_bid", "_offset", "_containingDir",
+               "_nextEntry", "_prevEntry")
+
   @property
   def size(self):
     """Gets the size of this entry in bytes."""
@@ -174,17 +192,19 @@ class _Entry(object):
     self._nextEntry = value
 
   
-  def __init__(self, blockIndex, blockId, blockOffset, prevEntry, byteString, containingDir):
-    """Contructs a new entry in the linked list."""
+  def __init__(self, blockIndex, blockId, blockOffset, prevEntry, byteString, containingDir, byteOffset = 0):
+    """Contructs a new entry in the linked list from the entry found at the byte offset of the
+    given byte string, so that entries can be read from a block without copying it."""
     
     if containingDir._fs._superblock.revisionMajor == 0:
-      fields = unpack_from("<IHH", byteString)
+      fields = _ENTRY_HEADER_REV0.unpack_from(byteString, byteOffset)
       self._fileType = 0
     else:
-      fields = unpack_from("<IHBB", byteString)
+      fields = _ENTRY_HEADER_REV1.unpack_from(byteString, byteOffset)
       self._fileType = fields[3]
     
-    self._name = unpack_from("<{0}s".format(fields[2]), byteString, 8)[0]
+    nameStart = byteOffset + 8
+    self._name = byteString[nameStart:nameStart+fields[2]]
     self._inodeNum = fields[0]
     self._size = fields[1]
     self._bindex = blockIndex
@@ -209,18 +229,38 @@ class _Entry(object):
 class Ext2Directory(Ext2File):
   """Represents a directory on the Ext2 filesystem."""
 
+  __slots__ = ("_entries",)
+
   @property
   def isDir(self):
     """Gets whether the file object is a directory."""
     return True
 
+  @property
+  def _entryList(self):
+    """Gets the entry list of this directory, which is read the first time it is needed."""
+    if self._entries is None:
+      self._entries = _EntryList(self)
+    return self._entries
+
 
   def __init__(self, dirEntry, inode, fs):
     """Constructs a new directory object from the specified directory entry."""
     super(Ext2Directory, self).__init__(dirEntry, inode, fs)
     if (self._inode.mode & 0x4000) != 0x4000:
       raise FilesystemError("Inode does not point to a directory.")
-    self._entryList = _EntryList(self)
+    self._entries = None
+
+
+  def _dataBlockIds(self):
+    """Gets the list of ids of the blocks holding this directory's entries."""
+    blockIds = []
+    for i in range(self.numBlocks):
+      blockId = self._inode.lookupBlockId(i)
+      if blockId == 0:
+        break
+      blockIds.append(blockId)
+    return blockIds
 
 
 
@@ -252,36 +292,46 @@ class Ext2Directory(Ext2File):
 
 
   def getFileAt(self, relativePath, followSymlinks = False):
-    """Looks up and returns the file specified by the relative path from this directory. Raises a
-    FileNotFoundError if the file cannot be found."""
+    """Looks up and returns the file specified by the relative path from this directory, from the
+    filesystem's preloaded tree where possible. Raises a FileNotFoundError if the file cannot be
+    found."""
     
-    pathParts = re.compile("/+").split(relativePath)
-    if len(pathParts) > 1 and pathParts[0] == "":
+    # names are stored as bytes, so a text path is encoded once rather than on every comparison
+    pathParts = _PATH_SEPARATOR.split(_encodeName(relativePath))
+    if len(pathParts) > 1 and pathParts[0] == b"":
       del pathParts[0]
-    if len(pathParts) > 1 and pathParts[-1] == "":
+    if len(pathParts) > 1 and pathParts[-1] == b"":
       del pathParts[-1]
     if len(pathParts) == 0:
       raise FileNotFoundError()
     if len(pathParts[0]) == 0:
       return self
     
+    # a path without . or .. components is first looked up in the filesystem's preloaded tree,
+    # which holds no followed symlinks
+    if self._fs._preloadedFiles and not (b"." in pathParts or b".." in pathParts):
+      path = "/".join(p.decode("utf-8", "surrogateescape") for p in pathParts)
+      if self.absolutePath != "/":
+        path = "{0}/{1}".format(self.absolutePath, path)
+      else:
+        path = "/{0}".format(path)
+      curFile = self._fs.getPreloadedFile(path)
+      if not curFile is None and not (followSymlinks and curFile.isSymlink):
+        return curFile
+    
     curFile = self
     for curPart in pathParts:
       if curFile.isDir:
-        found = False
-        for entry in curFile._entryList:
-          if entry.name == curPart:
-            curFile = Ext2Directory._openEntry(entry, self._fs)
-            while curFile.isSymlink and followSymlinks:
-              linkedPath = curFile.getLinkedPath()
-              if linkedPath.startswith("/"):
-                curFile = self._fs.rootDir.getFileAt(linkedPath[1:])
-              else:
-                curFile = curFile.parentDir.getFileAt(linkedPath)
-            found = True
-            break
-        if not found:
+        entry = curFile._entryList.find(curPart)
+        if entry is None:
           raise FileNotFoundError()
+        curFile = Ext2Directory._openEntry(entry, self._fs)
+        while curFile.isSymlink and followSymlinks:
+          linkedPath = curFile.getLinkedPath()
+          if linkedPath.startswith("/"):
+            curFile = self._fs.rootDir.getFileAt(linkedPath[1:])
+          else:
+            curFile = curFile.parentDir.getFileAt(linkedPath)
     
     if curFile.absolutePath == self.absolutePath:
       return self
@@ -341,10 +391,9 @@ class Ext2Directory(Ext2File):
     if fromFile.isDir:
       oldParent._inode.numLinks -= 1
       fromFile.parentDir._inode.numLinks += 1
-      for entry in fromFile._entryList:
-        if entry.name == "..":
-          entry.inodeNum = fromFile.parentDir._inode.number
-          break
+      entry = fromFile._entryList.find(b"..")
+      if entry:
+        entry.inodeNum = fromFile.parentDir._inode.number
 
 
 
@@ -368,7 +417,7 @@ class Ext2Directory(Ext2File):
     mode |= 0x0001 # others execute
     
     entry = self.__makeNewEntry(name, mode, uid, gid, True)
-    defaultEntries = pack("<IHBB1s3xIHBB2s", entry.inodeNum, 12, 1, 2, ".", self._inode.number, self._fs.blockSize-12, 2, 2, "..")
+    defaultEntries = pack("<IHBB1s3xIHBB2s", entry.inodeNum, 12, 1, 2, b".", self._inode.number, self._fs.blockSize-12, 2, 2, b"..")
     self._inode.numLinks += 1
     inode = self._fs._readInode(entry._inodeNum)
     inode.numLinks += 1
@@ -432,6 +481,7 @@ class Ext2Directory(Ext2File):
     mode |= 0x0004 # others read
     mode |= 0x0001 # others execute
     
+    linkedPath = _encodeName(linkedPath)
     size = len(linkedPath)
     if size <= 60:
       entry = self.__makeNewEntry(name, mode, uid, gid, False)
@@ -454,22 +504,22 @@ class Ext2Directory(Ext2File):
   def __validateName(self, name):
     """Validates the specified name and returns successfully if valid."""
     
+    name = _encodeName(name)
     if len(name.strip()) == 0:
       raise FilesystemError("No name specified.")
 
     if len(name) > 255:
       raise FilesystemError("Specified name is too long.")
 
-    if name == "." or name == "..":
+    if name == b"." or name == b"..":
       raise FilesystemError("Invalid name specified.")
 
-    if "/" in name or "\0" in name:
+    if b"/" in name or b"\0" in name:
       raise FilesystemError("Name contains invalid characters.")
 
     # make sure destination does not already exist
-    for entry in self._entryList:
-      if entry.name == name:
-        raise FilesystemError("An entry with that name already exists.")
+    if self._entryList.find(name):
+      raise FilesystemError("An entry with that name already exists.")
 
 
 
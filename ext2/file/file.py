@@ -10,9 +10,23 @@ from time import localtime, strftime
 from ..error import *
 
 
+# the rwx string shown for each of the 512 possible permission bitmaps
+_PERMISSION_STRS = tuple("".join(c if (m & (0x100 >> i)) != 0 else "-" for i, c in enumerate("rwxrwxrwx"))
+                         for m in range(512))
+
+
+def _encodeName(name):
+  """Encodes a file name or path to the bytes stored on disk, unless it is already bytes."""
+  if isinstance(name, bytes):
+    return name
+  return name.encode("utf-8", "surrogateescape")
+
+
 class Ext2File(object):
   """Represents a file or directory on the Ext2 filesystem."""
 
+  __slots__ = ("_fs", "_inode", "_dirEntry", "_name", "_parentDir", "_path")
+
   @property
   def fsType(self):
     """Gets a string representing the filesystem type."""
@@ -62,7 +76,13 @@ class Ext2File(object):
   @property
   def modeStr(self):
     """Gets a string representing the file object's mode."""
-    return "".join(self._modeStr)
+    if self.isDir:
+      typeChar = "d"
+    elif self.isSymlink:
+      typeChar = "l"
+    else:
+      typeChar = "-"
+    return typeChar + _PERMISSION_STRS[self._inode.mode & 0x1FF]
 
   @property
   def numLinks(self):
@@ -151,7 +171,7 @@ class Ext2File(object):
     self._name = ""
     
     if self._dirEntry:
-      self._name = self._dirEntry.name
+      self._name = self._dirEntry.name.decode("utf-8", "surrogateescape")
       
     
     # resolve current/up directories
@@ -164,11 +184,12 @@ class Ext2File(object):
     # determine absolute path to file
     if self._dirEntry:
       self._parentDir = self._dirEntry.containingDir
-      if self._parentDir.absolutePath == "/":
-        parentPath = ""
+      parentPath = self._parentDir._path
+      name = self._dirEntry.name.decode("utf-8", "surrogateescape")
+      if parentPath == "/":
+        self._path = "/" + name
       else:
-        parentPath = self._parentDir.absolutePath
-      self._path = "{0}/{1}".format(parentPath, self._dirEntry.name)
+        self._path = parentPath + "/" + name
     else:
       self._parentDir = self
       self._path = "/"
@@ -176,31 +197,6 @@ class Ext2File(object):
     if not self._parentDir.isDir:
       raise FilesystemError("Invalid parent directory.")
     
-
-    self._modeStr = list("----------")
-    if self.isDir:
-      self._modeStr[0] = "d"
-    elif self.isSymlink:
-      self._modeStr[0] = "l"
-    if (self._inode.mode & 0x0100) != 0:
-      self._modeStr[1] = "r"
-    if (self._inode.mode & 0x0080) != 0:
-      self._modeStr[2] = "w"
-    if (self._inode.mode & 0x0040) != 0:
-      self._modeStr[3] = "x"
-    if (self._inode.mode & 0x0020) != 0:
-      self._modeStr[4] = "r"
-    if (self._inode.mode & 0x0010) != 0:
-      self._modeStr[5] = "w"
-    if (self._inode.mode & 0x0008) != 0:
-      self._modeStr[6] = "x"
-    if (self._inode.mode & 0x0004) != 0:
-      self._modeStr[7] = "r"
-    if (self._inode.mode & 0x0002) != 0:
-      self._modeStr[8] = "w"
-    if (self._inode.mode & 0x0001) != 0:
-      self._modeStr[9] = "x"
-    
   
   def files(self):
     """Generates a list of files in the directory."""
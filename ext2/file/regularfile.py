@@ -10,9 +10,15 @@ from ..error import FilesystemError
 from .file import Ext2File
 
 
+# the most data blocks looked up ahead and read together while generating a file's blocks
+_BLOCKS_PER_READ = 64
+
+
 class Ext2RegularFile(Ext2File):
   """Represents a regular file on the Ext2 filesystem."""
 
+  __slots__ = ()
+
   @property
   def isRegular(self):
     """Gets whether the file object is a regular file."""
@@ -26,15 +32,25 @@ class Ext2RegularFile(Ext2File):
 
 
   def blocks(self):
-    """Generates a list of data blocks in the file."""
-    for i in range(self.numBlocks):
-      blockId = self._inode.lookupBlockId(i)
-      if blockId == 0:
-        break
-      block = self._fs._readBlock(blockId)
-      if (i+1) * self._fs.blockSize > self.size:
-        block = block[:(self.size % self._fs.blockSize)]
-      yield block
+    """Generates a list of data blocks in the file. The block ids are looked up a batch at a
+    time, so that each run of consecutive blocks in a batch is read from the device at once."""
+    blockSize = self._fs.blockSize
+    numBlocks = self.numBlocks
+    index = 0
+    while index < numBlocks:
+      blockIds = []
+      while index < numBlocks and len(blockIds) < _BLOCKS_PER_READ:
+        blockId = self._inode.lookupBlockId(index)
+        if blockId == 0:
+          numBlocks = index
+          break
+        blockIds.append(blockId)
+        index += 1
+      
+      for i, block in enumerate(self._fs._readBlocks(blockIds), index - len(blockIds)):
+        if (i+1) * blockSize > self.size:
+          block = block[:(self.size % blockSize)]
+        yield block
 
 
   def write(self, byteString, position = None):
@@ -44,23 +60,29 @@ class Ext2RegularFile(Ext2File):
     if position is None:
       position = self._inode.size
     
+    blockSize = self._fs.blockSize
     totalLength = len(byteString)
+    start = position
     written = 0
-    while written < totalLength:
-      blockIndex = position / self._fs.blockSize
-      byteIndex = position % self._fs.blockSize
+    # the size is written to the inode once for the whole call rather than once per block, and
+    # covers only the bytes actually written, even if allocating a block fails part way
+    try:
+      while written < totalLength:
+        blockIndex, byteIndex = divmod(position, blockSize)
 
-      bid = self._inode.lookupBlockId(blockIndex)
-      while bid == 0:
-        self._inode.assignNextBlockId(self._fs._allocateBlock())
         bid = self._inode.lookupBlockId(blockIndex)
-      
-      numBytesToWrite = min(len(byteString), self._fs.blockSize - byteIndex)
-      bytesToWrite = byteString[:numBytesToWrite]
-      byteString = byteString[numBytesToWrite:]
-      self._fs._writeToBlock(bid, byteIndex, bytesToWrite)
-      self._inode.size = max(position + numBytesToWrite, self._inode.size)
-      written += numBytesToWrite
-      position += numBytesToWrite
+        while bid == 0:
+          self._inode.assignNextBlockId(self._fs._allocateBlock())
+          bid = self._inode.lookupBlockId(blockIndex)
+        
+        numBytesToWrite = min(len(byteString), blockSize - byteIndex)
+        bytesToWrite = byteString[:numBytesToWrite]
+        byteString = byteString[numBytesToWrite:]
+        self._fs._writeToBlock(bid, byteIndex, bytesToWrite)
+        written += numBytesToWrite
+        position += numBytesToWrite
+    finally:
+      if written and start + written > self._inode.size:
+        self._inode.size = start + written
       
     
@@ -6,7 +6,6 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
-from struct import unpack_from
 from ..error import *
 from .file import Ext2File
 
@@ -14,6 +13,8 @@ from .file import Ext2File
 class Ext2Symlink(Ext2File):
   """Represents a symbolic link to a file or directory on the Ext2 filesystem."""
 
+  __slots__ = ()
+
   @property
   def isSymlink(self):
     """Gets whether the file object is a symbolic link."""
@@ -29,10 +30,9 @@ class Ext2Symlink(Ext2File):
   def getLinkedPath(self):
     """Gets the file path linked to by this symbolic link."""
     if self._inode.size <= 60:
-      path = self._inode.getStringFromBlocks()
+      pathBytes = self._inode.getStringFromBlocks()
     else:
       pathBytes = self._fs._readBlock(self._inode.lookupBlockId(0), 0, self._inode.size)
-      path = unpack_from("<{0}s".format(self._inode.size), pathBytes)
     
-    return path
+    return pathBytes.decode("utf-8", "surrogateescape")
   
\ No newline at end of file
@@ -6,15 +6,24 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
-from struct import pack,unpack_from
-from math import ceil
+from struct import Struct
 from time import time
 from ..error import FilesystemError
 
 
+# layout of the fields read from a 32-byte block group descriptor, including its padding
+_ENTRY = Struct("<3I3H14x")
+
+# precompiled layout of the counts written back by the entry setters
+_UINT16 = Struct("<H")
+
+
 class _BGDTEntry(object):
   """Models an entry in the block group descriptor table. For internal use only."""
 
+  __slots__ = ("_superblock", "_device", "_startPos", "_blockBitmapBid", "_inodeBitmapBid",
+               "_inodeTableBid", "_numFreeBlocks", "_numFreeInodes", "_numInodesAsDirs")
+
   @property
   def blockBitmapLocation(self):
     """Gets the block id of the block bitmap for this block group."""
@@ -38,7 +47,7 @@ class _BGDTEntry(object):
   def numFreeBlocks(self, value):
     """Sets the number of free blocks."""
     self._numFreeBlocks = value
-    self.__writeData(12, pack("<H", self._numFreeBlocks))
+    self.__writeData(12, _UINT16.pack(self._numFreeBlocks))
 
 
   @property
@@ -49,7 +58,7 @@ class _BGDTEntry(object):
   def numFreeInodes(self, value):
     """Sets the number of free inodes."""
     self._numFreeInodes = value
-    self.__writeData(14, pack("<H", self._numFreeInodes))
+    self.__writeData(14, _UINT16.pack(self._numFreeInodes))
 
 
   @property
@@ -60,7 +69,7 @@ class _BGDTEntry(object):
   def numInodesAsDirs(self, value):
     """Sets the number of inodes used as directories."""
     self._numInodesAsDirs = value
-    self.__writeData(16, pack("<H", self._numInodesAsDirs))
+    self.__writeData(16, _UINT16.pack(self._numInodesAsDirs))
     
   
   def __init__(self, startPos, device, superblock, fields):
@@ -105,10 +114,10 @@ class _BGDT(object):
     and returns the new object."""
 
     startPos = (bgNumCopy * superblock.numBlocksPerGroup + superblock.firstDataBlockId + 1) * superblock.blockSize
-    numBgdtBlocks = int(ceil(float(superblock.numBlockGroups * 32) / superblock.blockSize))
-    inodeTableBlocks = int(ceil(float(superblock.numInodesPerGroup * superblock.inodeSize) / superblock.blockSize))
+    numBgdtBlocks = -(-superblock.numBlockGroups * 32 // superblock.blockSize)
+    inodeTableBlocks = -(-superblock.numInodesPerGroup * superblock.inodeSize // superblock.blockSize)
 
-    bgdtBytes = ""
+    bgdtBytes = b""
     for bgroupNum in range(superblock.numBlockGroups):
       
       bgroupStartBid = bgroupNum * superblock.numBlocksPerGroup + superblock.firstDataBlockId
@@ -144,8 +153,6 @@ class _BGDT(object):
       
       # if this is the first copy of the BGDT being written, also write new bitmaps
       if bgNumCopy == 0:
-        fmt = ["B"] * superblock.blockSize
-        
         blockBitmap = [0] * superblock.blockSize
         bitmapIndex = 0
         for i in range(numUsedBlocks):
@@ -159,7 +166,7 @@ class _BGDT(object):
         while padBitIndex < superblock.blockSize:
           blockBitmap[padBitIndex >> 8] |= (1 << (padBitIndex & 0x07))
           padBitIndex += 1
-        blockBitmapBytes = "".join(map(pack, fmt, blockBitmap))
+        blockBitmapBytes = bytes(blockBitmap)
         device.write(blockBitmapLocation * superblock.blockSize, blockBitmapBytes)
 
         inodeBitmap = [0] * superblock.blockSize
@@ -169,14 +176,12 @@ class _BGDT(object):
           inodeBitmap[bitmapIndex] |= 1
           if (i+1) % 8 == 0:
             bitmapIndex += 1
-        inodeBitmapBytes = "".join(map(pack, fmt, inodeBitmap))
+        inodeBitmapBytes = bytes(inodeBitmap)
         device.write(inodeBitmapLocation * superblock.blockSize, inodeBitmapBytes)
         
-      entryBytes = pack("<3I3H", blockBitmapLocation, inodeBitmapLocation, inodeTableLocation,
-                        numFreeBlocks, numFreeInodes, numInodesAsDirs)
-      zeros = [0] * 14
-      fmt = ["B"] * 14
-      bgdtBytes = "{0}{1}{2}".format(bgdtBytes, entryBytes, "".join(map(pack, fmt, zeros)))
+      entryBytes = _ENTRY.pack(blockBitmapLocation, inodeBitmapLocation, inodeTableLocation,
+                               numFreeBlocks, numFreeInodes, numInodesAsDirs)
+      bgdtBytes += entryBytes
     
     device.write(startPos, bgdtBytes)
     
@@ -188,18 +193,15 @@ class _BGDT(object):
     """Reads a BDGT at the specified group number and returns the new object."""
     startPos = (groupId * superblock.numBlocksPerGroup + superblock.firstDataBlockId + 1) * superblock.blockSize
     tableSize = superblock.numBlockGroups * 32
-    bgdtBytes = device.read(startPos, tableSize)
-    if len(bgdtBytes) < tableSize:
-      raise FilesystemError("Invalid block group descriptor table.")
-    return cls(bgdtBytes, superblock, device)
+    return cls(device.read(startPos, tableSize), superblock, device)
   
   
   def __init__(self, bgdtBytes, superblock, device):
     """Constructs a new BGDT from the given byte array."""
+    numEntries = superblock.numBlockGroups
     self._entries = []
-    for i in range(superblock.numBlockGroups):
-      startPos = i * 32
-      fields = unpack_from("<3I3H", bgdtBytes, startPos)
-      self._entries.append(_BGDTEntry(startPos, device, superblock, fields))
+    # entries are streamed from a single fixed layout without building one for the whole table
+    for i, fields in enumerate(_ENTRY.iter_unpack(bgdtBytes[:numEntries * 32])):
+      self._entries.append(_BGDTEntry(i * 32, device, superblock, fields))
 
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Defines lookup tables and functions for scanning the inode and block bitmaps used by the ext2 module.
+"""
+__license__ = "BSD"
+__copyright__ = "Copyright 2013, Michael R. Falcone"
+
+
+import re
+
+
+# the indices of the set bits in each possible bitmap byte, least significant bit first
+_SET_BITS = tuple(tuple(i for i in range(8) if (byte >> i) & 1) for byte in range(256))
+
+# the indices of the clear bits in each possible bitmap byte, least significant bit first
+_CLEAR_BITS = tuple(_SET_BITS[~byte & 0xFF] for byte in range(256))
+
+# runs of bitmap bytes that each have at least one bit set
+_USED_RUNS = re.compile(b"[^\\x00]+")
+
+# a bitmap byte that has at least one bit clear
+_FREE_BYTE = re.compile(b"[^\\xff]")
+
+
+def _getSetBits(bitmap):
+  """Returns a sorted list of the indices of the set bits in the specified bitmap. Runs of clear
+  bytes are skipped by a single search rather than examined byte by byte."""
+  indices = []
+  for run in _USED_RUNS.finditer(bitmap):
+    bitIndex = run.start() * 8
+    for byte in run.group():
+      if byte == 0xFF:
+        indices.extend(range(bitIndex, bitIndex + 8))
+      else:
+        indices.extend(bitIndex + i for i in _SET_BITS[byte])
+      bitIndex += 8
+  return indices
+
+
+
+def _findClearBit(bitmap, startBit = 0):
+  """Returns the index of the first clear bit in the specified bitmap at or after the specified
+  bit index, or None if all of those bits are set. Full bytes are skipped by a single search."""
+  byteIndex = startBit >> 3
+  if byteIndex >= len(bitmap):
+    return None
+  
+  # bits of the first byte that are before the start bit are treated as set
+  byte = bitmap[byteIndex] | ((1 << (startBit & 0x07)) - 1)
+  if byte == 0xFF:
+    match = _FREE_BYTE.search(bitmap, byteIndex + 1)
+    if match is None:
+      return None
+    byteIndex = match.start()
+    byte = bitmap[byteIndex]
+  return (byteIndex << 3) + _CLEAR_BITS[byte][0]
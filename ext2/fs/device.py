@@ -6,11 +6,25 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
+import mmap
+import os
 from os import fsync, path, makedirs
 from struct import pack
+from threading import Lock
 from ..error import FilesystemError
 
 
+# access pattern hints that may be given for regions of a memory mapped device
+_ADVICE = {
+  "sequential": getattr(mmap, "MADV_SEQUENTIAL", None),
+  "random": getattr(mmap, "MADV_RANDOM", None),
+  "willneed": getattr(mmap, "MADV_WILLNEED", None),
+}
+
+# positional read that leaves the file offset alone, where the platform has one
+_pread = getattr(os, "pread", None)
+
+
 class _DeviceFromFile(object):
   """Represents a device from a filesystem image file."""
   
@@ -19,6 +33,16 @@ class _DeviceFromFile(object):
     """Returns whether the device is currently mounted."""
     return (not self._imageFile is None)
 
+  @property
+  def size(self):
+    """Gets the size of the mounted device in bytes."""
+    return self._imageSize
+
+  @property
+  def acceptsAdvice(self):
+    """Returns whether access pattern hints given to the mounted device have any effect."""
+    return bool(self._imageMap) and hasattr(self._imageMap, "madvise")
+
   @classmethod
   def makeNew(cls, imageFilename, numBytes):
     """Creates a new device image with the specified filename."""
@@ -41,34 +65,80 @@ class _DeviceFromFile(object):
     """Constructs a new device object from the specified file."""
     self._imageFilename = filename
     self._imageFile = None
+    self._imageMap = None
+    self._lock = Lock()
+  
+  def __getstate__(self):
+    """Gets the state used to pickle the device, which is only its filename."""
+    return self._imageFilename
+  
+  def __setstate__(self, filename):
+    """Restores a pickled device. The restored device is not mounted."""
+    self.__init__(filename)
   
   def mount(self):
     """Opens reading/writing from/to the device."""
     self._imageFile = open(self._imageFilename, "r+b")
+    self._imageFd = self._imageFile.fileno()
     self._imageFile.seek(0, 2)
     self._imageSize = self._imageFile.tell()
     self._imageFile.seek(0)
+    # reads and writes go through a shared memory map of the image where one can be made, as
+    # slicing the map takes no system call and no lock; otherwise reads use pread where the
+    # platform has it, and the file is used under the lock
+    try:
+      self._imageMap = mmap.mmap(self._imageFile.fileno(), 0)
+    except (EnvironmentError, ValueError):
+      self._imageMap = None
 
   def unmount(self):
     """Closes reading/writing from/to the device."""
+    if self._imageMap:
+      self._imageMap.flush()
+      self._imageMap.close()
+    self._imageMap = None
     if self._imageFile:
       self._imageFile.flush()
       fsync(self._imageFile.fileno())
       self._imageFile.close()
     self._imageFile = None
 
+  def advise(self, position, size, hint):
+    """Hints to the kernel how the specified region of the device will be accessed, where hint
+    is one of "sequential", "random" or "willneed". Does nothing where hints are unsupported."""
+    advice = _ADVICE[hint]
+    if advice is None or not self.acceptsAdvice:
+      return
+    start = position - position % mmap.PAGESIZE
+    end = min(position + size, self._imageSize)
+    if end > start:
+      self._imageMap.madvise(advice, start, end - start)
+
   def read(self, position, size):
-    """Reads a byte string of the specified size from the specified position."""
+    """Reads a byte string of the specified size from the specified position. Raises an error if
+    any of the requested bytes lie past the end of the device, as a corrupt inode table or block
+    id can ask for."""
     assert self.isMounted, "Device not mounted."
-    assert position+size <= self._imageSize, "Requested bytes out of range."
-    self._imageFile.seek(position)
-    return self._imageFile.read(size)
+    if position < 0 or position+size > self._imageSize:
+      raise FilesystemError("Requested bytes out of range.")
+    if self._imageMap:
+      return self._imageMap[position:position+size]
+    if _pread:
+      return _pread(self._imageFd, size, position)
+    with self._lock:
+      self._imageFile.seek(position)
+      return self._imageFile.read(size)
   
   def write(self, position, byteString):
-    """Writes the specified byte string to the specified byte position."""
+    """Writes the specified byte string to the specified byte position. Raises an error if the
+    bytes would extend past the end of the device."""
     assert self.isMounted, "Device not mounted."
-    assert position+len(byteString) <= self._imageSize,\
-      "Invalid device position [device size: {0} bytes].".format(self._imageSize)
-    self._imageFile.seek(position)
-    self._imageFile.write(byteString)
-    self._imageFile.flush()
+    if position < 0 or position+len(byteString) > self._imageSize:
+      raise FilesystemError("Invalid device position [device size: {0} bytes].".format(self._imageSize))
+    if self._imageMap:
+      self._imageMap[position:position+len(byteString)] = byteString
+      return
+    with self._lock:
+      self._imageFile.seek(position)
+      self._imageFile.write(byteString)
+      self._imageFile.flush()
@@ -6,19 +6,39 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
-import inspect
 from uuid import uuid4
 from os import path, remove
-from collections import deque
-from struct import pack, unpack
+from collections import OrderedDict
+from bisect import bisect_left
+from struct import pack
 from time import time
-from math import ceil
+from threading import RLock
 from ..file.directory import _openRootDirectory
 from ..error import FilesystemError
 from .superblock import _Superblock
-from .bgdt import _BGDT
-from .inode import _Inode
+from .bgdt import _BGDT, _BGDTEntry
+from .inode import _Inode, _unpackBidList
 from .device import _DeviceFromFile
+from .bitmap import _findClearBit, _getSetBits
+
+
+# the public fields compared across shadow copies of the superblock and of the BGDT entries
+_SUPERBLOCK_FIELDS = tuple(sorted(n for n, v in vars(_Superblock).items()
+                                  if isinstance(v, property) and not n.startswith("_")))
+_BGDT_ENTRY_FIELDS = tuple(sorted(n for n, v in vars(_BGDTEntry).items()
+                                  if isinstance(v, property) and not n.startswith("_")))
+
+
+def _getFieldValues(obj, fields):
+  """Gets a dictionary of the values of the specified fields of an object, leaving out any field
+  that cannot be read."""
+  values = {}
+  for m in fields:
+    try:
+      values[m] = getattr(obj, m)
+    except AttributeError:
+      pass
+  return values
 
 
 class InformationReport(object):
@@ -28,6 +48,8 @@ class InformationReport(object):
 
 class Ext2Filesystem(object):
   """Models a filesystem image file formatted to Ext2."""
+  maxCachedInodes = 4096
+  maxCachedBidLists = 64
   
   
   @property
@@ -38,38 +60,38 @@ class Ext2Filesystem(object):
   @property
   def revision(self):
     """Gets the filesystem revision string formatted as MAJOR.MINOR."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return "{0}.{1}".format(self._superblock.revisionMajor, self._superblock.revisionMinor)
   
   @property
   def totalSpace(self):
     """Gets the total filesystem size in bytes."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return self._superblock.blockSize * self._superblock.numBlocks
   
   @property
   def freeSpace(self):
     """Gets the number of free bytes."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return self._superblock.blockSize * self._superblock.numFreeBlocks
   
   @property
   def usedSpace(self):
     """Gets the number of used bytes."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return self.totalSpace - self.freeSpace
 
   @property
   def totalFileSpace(self):
     """Gets the total number of bytes available for files."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
-    bgdtBlocks = int(ceil(float(self._superblock.numBlockGroups * 32) / self._superblock.blockSize))
-    inodeTableBlocks = int(ceil(float(self._superblock.numInodesPerGroup * self._superblock.inodeSize) / self._superblock.blockSize))
+    bgdtBlocks = -(-self._superblock.numBlockGroups * 32 // self._superblock.blockSize)
+    inodeTableBlocks = -(-self._superblock.numInodesPerGroup * self._superblock.inodeSize // self._superblock.blockSize)
     numFileBlocks = (self._superblock.numBlocks - self._superblock.firstDataBlockId - inodeTableBlocks * self._superblock.numBlockGroups
                      - 2 * self._superblock.numBlockGroups - (1 + bgdtBlocks) * (len(self._superblock.copyLocations) + 1))
     return numFileBlocks * self._superblock.blockSize
@@ -77,28 +99,28 @@ class Ext2Filesystem(object):
   @property
   def blockSize(self):
     """Gets the block size in bytes."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return self._superblock.blockSize
   
   @property
   def numBlockGroups(self):
     """Gets the number of block groups."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return len(self._bgdt.entries)
   
   @property
   def numInodes(self):
     """Gets the total number of inodes."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return self._superblock.numInodes
   
   @property
   def rootDir(self):
     """Gets the file object representing the root directory."""
-    if not self.isValid:
+    if not self._isValid:
       raise FilesystemError("Filesystem is not valid.")
     return _openRootDirectory(self)
 
@@ -134,8 +156,7 @@ class Ext2Filesystem(object):
 
       # write root directory
       rootInodeOffset = bgdt.entries[0].inodeTableLocation * superblock.blockSize + superblock.inodeSize
-      zeroFill = [0] * (superblock.inodeSize - 26)
-      fillFmt = ["B"] * (superblock.inodeSize - 26)
+      fillSize = superblock.inodeSize - 26
       uid = 0
       gid = 0
       mode = 0
@@ -148,7 +169,7 @@ class Ext2Filesystem(object):
       mode |= 0x0004 # others read
       mode |= 0x0001 # others execute
       rootInodeBytes = pack("<2HI4IH", mode, uid, 0, currentTime, currentTime, currentTime, 0, gid)
-      rootInodeBytes = "{0}{1}".format(rootInodeBytes, "".join(map(pack, fillFmt, zeroFill)))
+      rootInodeBytes += b"\0" * fillSize
       device.write(rootInodeOffset, rootInodeBytes)
       
       superblock._saveCopies = True
@@ -160,7 +181,7 @@ class Ext2Filesystem(object):
       fs._isValid = True
       
       rootBid = fs._allocateBlock(True)
-      defaultEntries = pack("<IHBB1s3xIHBB2s", 2, 12, 1, 2, ".", 2, blockSize - 12, 2, 2, "..")
+      defaultEntries = pack("<IHBB1s3xIHBB2s", 2, 12, 1, 2, b".", 2, blockSize - 12, 2, 2, b"..")
       fs._writeToBlock(rootBid, 0, defaultEntries)
       
       rootInode = fs._readInode(2)
@@ -201,6 +222,25 @@ class Ext2Filesystem(object):
     """Constructs a new Ext2 filesystem from the specified device object."""
     self._device = device
     self._isValid = False
+    self._preloadedFiles = {}
+    # the caches may be used by several threads reading the mounted filesystem at once, so they
+    # are only looked up and updated while holding the cache lock; a missing entry is also read
+    # under the lock, so that each inode has a single object. Writing is not safe across threads.
+    self._cacheLock = RLock()
+    self._inodeCache = OrderedDict()
+    self._bidListCache = OrderedDict()
+  
+  def __getstate__(self):
+    """Gets the state used to pickle the filesystem, which is its device and whether it is
+    mounted. This allows the filesystem to be handed to another process."""
+    return (self._device, self._isValid)
+  
+  def __setstate__(self, state):
+    """Restores a pickled filesystem, mounting it again if it was mounted when pickled."""
+    device, mounted = state
+    self.__init__(device)
+    if mounted:
+      self.mount()
   
   def __del__(self):
     """Destructor that unmounts the filesystem if it has not been unmounted."""
@@ -223,10 +263,18 @@ class Ext2Filesystem(object):
     error if the root directory cannot be read."""
     self._device.mount()
     try:
+      # the device size is checked once here, so that reads of the superblock, descriptor tables,
+      # inodes and blocks need not check for short reads
+      if self._device.size < 2048:
+        raise FilesystemError("Invalid superblock.")
       self._superblock = _Superblock.read(1024, self._device)
+      if self._device.size < self._superblock.numBlocks * self._superblock.blockSize:
+        raise FilesystemError("Device is smaller than the filesystem.")
       self._bgdt = _BGDT.read(0, self._superblock, self._device)
       self._isValid = True
-      _openRootDirectory(self)
+      self.__adviseMetadataAccess()
+      # the root directory's entries are read here so that an unreadable root fails the mount
+      _openRootDirectory(self)._entryList
     except:
       if self._device.isMounted:
         self._device.unmount()
@@ -242,38 +290,130 @@ class Ext2Filesystem(object):
     if self._device.isMounted:
       self._device.unmount()
     self._isValid = False
+    self._preloadedFiles = {}
+    with self._cacheLock:
+      self._inodeCache.clear()
+      self._bidListCache.clear()
+  
+  
+  
+  def __adviseMetadataAccess(self):
+    """Hints to the device that the superblock and block group descriptor table at the start
+    of the device are read in order, and that the inode tables are read at random."""
+    blockSize = self._superblock.blockSize
+    bgdtEnd = (self._superblock.firstDataBlockId + 1) * blockSize + self._superblock.numBlockGroups * 32
+    self._device.advise(0, bgdtEnd, "sequential")
+    for pos, size in self.__inodeTableRegions():
+      self._device.advise(pos, size, "random")
+  
+  
+  
+  def __prefetchInodeTables(self):
+    """Hints to the device that the inode tables of every block group are about to be read."""
+    for pos, size in self.__inodeTableRegions():
+      self._device.advise(pos, size, "willneed")
+  
+  
+  
+  def __inodeTableRegions(self):
+    """Generates the byte position and size of the inode table of each block group."""
+    tableSize = self._superblock.numInodesPerGroup * self._superblock.inodeSize
+    for entry in self._bgdt.entries:
+      yield (entry.inodeTableLocation * self._superblock.blockSize, tableSize)
+  
+  
+  
+  def walk(self, directory = None):
+    """Generates every file below the specified directory, or below the root directory if none is
+    specified, in breadth-first order. The "." and ".." entries are skipped and symbolic links are
+    not followed."""
+    assert self._isValid, "Filesystem is not valid."
+    
+    # walking a tree opens the inode of every entry, so the inode tables are read ahead up front
+    # and paged in by the kernel while the directories are being listed
+    self.__prefetchInodeTables()
+    level = [directory or self.rootDir]
+    while len(level) > 0:
+      # the entry blocks of a whole level of directories are read ahead before any is listed
+      self.__prefetchDirectories(level)
+      nextLevel = []
+      for d in level:
+        for f in d.files():
+          if f.name == "." or f.name == "..":
+            continue
+          if f.isDir:
+            nextLevel.append(f)
+          yield f
+      level = nextLevel
+  
+  
+  
+  def __prefetchDirectories(self, directories):
+    """Hints to the device that the entry blocks of the specified directories are about to be
+    read, with each run of consecutive block ids hinted at once."""
+    if not self._device.acceptsAdvice:
+      return
+    bids = sorted(bid for d in directories for bid in d._dataBlockIds())
+    blockSize = self._superblock.blockSize
+    i = 0
+    while i < len(bids):
+      runStart = i
+      i += 1
+      while i < len(bids) and bids[i] <= bids[i-1] + 1:
+        i += 1
+      self._device.advise(bids[runStart] * blockSize, (bids[i-1] - bids[runStart] + 1) * blockSize, "willneed")
+  
+  
+  
+  def preloadTree(self):
+    """Walks the directory tree once and remembers the file object found at each absolute path,
+    so that later lookups through getFileAt need not traverse the directories from the root.
+    Symbolic links are not followed. The preloaded files become stale once the filesystem is
+    modified, and should then be forgotten with clearPreloadedTree()."""
+    assert self._isValid, "Filesystem is not valid."
+    
+    root = self.rootDir
+    files = {"/": root}
+    for f in self.walk(root):
+      files[f.absolutePath] = f
+    self._preloadedFiles = files
+  
+  
+  
+  def getPreloadedFile(self, absolutePath):
+    """Gets the preloaded file object at the specified absolute path, or None if no file was
+    preloaded at that path."""
+    return self._preloadedFiles.get(absolutePath)
+  
+  
+  
+  def clearPreloadedTree(self):
+    """Forgets all file objects remembered by preloadTree()."""
+    self._preloadedFiles = {}
   
   
   
   
   def scanBlockGroups(self):
     """Scans all block groups and returns an information report about them."""
-    assert self.isValid, "Filesystem is not valid."
+    assert self._isValid, "Filesystem is not valid."
     
     report = InformationReport()
-
     report.spaceUsed = 0
     
     # count files and directories
     report.numRegFiles = 0
     report.numSymlinks = 0
     report.numDirs = 1 # initialize with root directory
-    q = deque([])
-    q.append(self.rootDir)
-    while len(q) > 0:
-      d = q.popleft()
-      for f in d.files():
-        if f.name == "." or f.name == "..":
-          continue
-        for b in f._inode.usedBlocks():
-          report.spaceUsed += self._superblock.blockSize
-        if f.isDir:
-          report.numDirs += 1
-          q.append(f)
-        elif f.isRegular:
-          report.numRegFiles += 1
-        elif f.isSymlink:
-          report.numSymlinks += 1
+    for f in self.walk():
+      for b in f._inode.usedBlocks():
+        report.spaceUsed += self._superblock.blockSize
+      if f.isDir:
+        report.numDirs += 1
+      elif f.isRegular:
+        report.numRegFiles += 1
+      elif f.isSymlink:
+        report.numSymlinks += 1
     
     # report block group information
     report.groupReports = []
@@ -294,7 +434,7 @@ class Ext2Filesystem(object):
   
   def checkIntegrity(self):
     """Evaluates the integrity of the filesystem and returns an information report."""
-    assert self.isValid, "Filesystem is not valid."
+    assert self._isValid, "Filesystem is not valid."
     
     report = InformationReport()
     checkPassed = True
@@ -311,42 +451,59 @@ class Ext2Filesystem(object):
       sbCopiesGood = True
       bgdtCopiesGood = True
       
+      # every shadow superblock and BGDT is hinted to the device up front, so that the copies are
+      # paged in together rather than one group at a time as they are compared
+      copySize = self._superblock.blockSize + self._superblock.numBlockGroups * 32
+      for groupId in self._superblock.copyLocations[1:]:
+        startPos = (groupId * self._superblock.numBlocksPerGroup + self._superblock.firstDataBlockId) * self._superblock.blockSize
+        self._device.advise(startPos, copySize, "willneed")
+      
       firstSbCopyStartPos = (self._superblock.copyLocations[1] * self._superblock.numBlocksPerGroup
                              + self._superblock.firstDataBlockId) * self._superblock.blockSize
       firstSbCopy = _Superblock.read(firstSbCopyStartPos, self._device)
 
       firstBgtCopy = _BGDT.read(self._superblock.copyLocations[1], firstSbCopy, self._device)
 
-      sbMembers = dict(inspect.getmembers(firstSbCopy))
-      bgtMembersEntries = map(dict, map(inspect.getmembers, firstBgtCopy.entries))
+      sbMembers = _getFieldValues(firstSbCopy, _SUPERBLOCK_FIELDS)
+      bgtMembersEntries = [_getFieldValues(e, _BGDT_ENTRY_FIELDS) for e in firstBgtCopy.entries]
+      
+      # a copy whose bytes match the first shadow copy is consistent without being parsed, so only
+      # copies that differ are compared field by field; the 2-byte block group number at offset 90
+      # differs between superblock copies and is left out of the byte comparison
+      bgdtSize = self._superblock.numBlockGroups * 32
+      firstSbCopyBytes = self._device.read(firstSbCopyStartPos, 1024)
+      firstSbCopyBytes = firstSbCopyBytes[:90] + firstSbCopyBytes[92:]
+      firstBgtCopyBytes = self._device.read(firstSbCopyStartPos + self._superblock.blockSize, bgdtSize)
       
       for groupId in self._superblock.copyLocations:
         if groupId == 0:
           continue
         
         # evaluate superblock copy consistency
-        try:
-          startPos = (groupId * self._superblock.numBlocksPerGroup + self._superblock.firstDataBlockId) * self._superblock.blockSize
-          sbCopy = _Superblock.read(startPos, self._device)
-          sbCopyMembers = dict(inspect.getmembers(sbCopy))
-        except:
-          report.messages.append("Superblock at block group {0} could not be read.".format(groupId))
-          sbCopiesGood = False
-          continue
-        for m in sbMembers:
-          if m.startswith("_"):
-            continue
-          if not m in sbCopyMembers:
-            report.messages.append("Superblock at block group {0} has missing field '{1}'.".format(groupId, m))
-            sbCopiesGood = False
-          elif not sbCopyMembers[m] == sbMembers[m]:
-            report.messages.append("Superblock at block group {0} has inconsistent field '{1}' with value '{2}' (first shadow copy has value '{3}').".format(groupId, m, sbCopyMembers[m], sbMembers[m]))
+        startPos = (groupId * self._superblock.numBlocksPerGroup + self._superblock.firstDataBlockId) * self._superblock.blockSize
+        sbCopyBytes = self._device.read(startPos, 1024)
+        if sbCopyBytes[:90] + sbCopyBytes[92:] != firstSbCopyBytes:
+          try:
+            sbCopy = _Superblock.read(startPos, self._device)
+            sbCopyMembers = _getFieldValues(sbCopy, _SUPERBLOCK_FIELDS)
+          except:
+            report.messages.append("Superblock at block group {0} could not be read.".format(groupId))
             sbCopiesGood = False
+            continue
+          for m in sbMembers:
+            if not m in sbCopyMembers:
+              report.messages.append("Superblock at block group {0} has missing field '{1}'.".format(groupId, m))
+              sbCopiesGood = False
+            elif not sbCopyMembers[m] == sbMembers[m]:
+              report.messages.append("Superblock at block group {0} has inconsistent field '{1}' with value '{2}' (first shadow copy has value '{3}').".format(groupId, m, sbCopyMembers[m], sbMembers[m]))
+              sbCopiesGood = False
         
         # evaluate block group descriptor table consistency
+        if self._device.read(startPos + self._superblock.blockSize, bgdtSize) == firstBgtCopyBytes:
+          continue
         try:
           bgtCopy = _BGDT.read(groupId, self._superblock, self._device)
-          bgtCopyMembersEntries = map(dict, map(inspect.getmembers, bgtCopy.entries))
+          bgtCopyMembersEntries = [_getFieldValues(e, _BGDT_ENTRY_FIELDS) for e in bgtCopy.entries]
         except:
           report.messages.append("Block group descriptor table at block group {0} could not be read.".format(groupId))
           bgdtCopiesGood = False
@@ -359,8 +516,6 @@ class Ext2Filesystem(object):
           bgtPrimaryEntryMembers = bgtMembersEntries[entryNum]
           bgtCopyEntryMembers = bgtCopyMembersEntries[entryNum]
           for m in bgtPrimaryEntryMembers:
-            if m.startswith("_"):
-              continue
             if not m in bgtCopyEntryMembers:
               report.messages.append("Block group descriptor table entry {0} at block group {1} has missing field '{2}'.".format(entryNum, groupId, m))
               bgdtCopiesGood = False
@@ -380,45 +535,37 @@ class Ext2Filesystem(object):
     # validate inode and block references
     blocksGood = True
     inodesGood = True
-    inodes = self.__getUsedInodes()
-    inodesReachable = dict(zip(inodes, [False] * len(inodes)))
-    blocks = self.__getUsedBlocks()
-    blocksAccessedBy = dict(zip(blocks, [None] * len(blocks)))
+    # used numbers are hashed once, and blocks are only recorded against a file once referenced
+    usedInodes = set(self.__getUsedInodes())
+    reachedInodes = set()
+    usedBlocks = set(self.__getUsedBlocks())
+    blocksAccessedBy = {}
     
-    q = deque([])
-    q.append(self.rootDir)
-    while len(q) > 0:
-      d = q.popleft()
-      for f in d.files():
-        if f.name == "." or f.name == "..":
-          continue
-        if f.isDir:
-          q.append(f)
-        
-        # check inode references
-        if not (f.isValid and f.inodeNum in inodesReachable):
-          report.messages.append("The filesystem contains an entry for {0} but its inode is not marked as used (inode number {1}).".format(f.absolutePath, f.inodeNum))
-          inodesGood = False
-        else:
-          inodesReachable[f.inodeNum] = True
-        
-        # check block references
-        if not f.isSymlink or f.size > 60:
-          for bid in f._inode.usedBlocks():
-            if not bid in blocksAccessedBy:
-              report.messages.append("The file {0} is referencing a block that is not marked as used by the filesystem (block id: {1})".format(f.absolutePath, bid))
-              blocksGood = False
-            elif blocksAccessedBy[bid]:
-              report.messages.append("Block id {0} is being referenced by both {1} and {2}.".format(bid, blocksAccessedBy[bid], f.absolutePath))
-              blocksGood = False
-            else:
-              blocksAccessedBy[bid] = f.absolutePath
+    for f in self.walk():
+      # check inode references
+      if not (f.isValid and f.inodeNum in usedInodes):
+        report.messages.append("The filesystem contains an entry for {0} but its inode is not marked as used (inode number {1}).".format(f.absolutePath, f.inodeNum))
+        inodesGood = False
+      else:
+        reachedInodes.add(f.inodeNum)
+      
+      # check block references
+      if not f.isSymlink or f.size > 60:
+        filePath = f.absolutePath
+        for bid in f._inode.usedBlocks():
+          if not bid in usedBlocks:
+            report.messages.append("The file {0} is referencing a block that is not marked as used by the filesystem (block id: {1})".format(filePath, bid))
+            blocksGood = False
+          elif bid in blocksAccessedBy:
+            report.messages.append("Block id {0} is being referenced by both {1} and {2}.".format(bid, blocksAccessedBy[bid], filePath))
+            blocksGood = False
+          else:
+            blocksAccessedBy[bid] = filePath
     
     
-    for inodeNum in inodesReachable:
-      if not inodesReachable[inodeNum]:
-        report.messages.append("Inode number {0} is marked as used but is not reachable from a directory entry.".format(inodeNum))
-        inodesGood = False
+    for inodeNum in sorted(usedInodes - reachedInodes):
+      report.messages.append("Inode number {0} is marked as used but is not reachable from a directory entry.".format(inodeNum))
+      inodesGood = False
 
     if blocksGood:
       report.messages.append("Block references look good.")
@@ -435,12 +582,10 @@ class Ext2Filesystem(object):
     totalFreeInodes = 0
     
     for entryNum,entry in enumerate(self._bgdt.entries):
-      blockBitmap = unpack("{0}B".format(self._superblock.blockSize), self._readBlock(entry.blockBitmapLocation))
-      inodeBitmap = unpack("{0}B".format(self._superblock.blockSize), self._readBlock(entry.inodeBitmapLocation))
-      usedBlockCount = 0
+      blockBitmap = bytearray(self._readBlock(entry.blockBitmapLocation))
+      inodeBitmap = bytearray(self._readBlock(entry.inodeBitmapLocation))
       usedInodeCount = 0
       dirCount = 0
-      index = 0
       
       maxBlocks = self._superblock.numBlocksPerGroup
       maxInodes = self._superblock.numInodesPerGroup
@@ -448,17 +593,15 @@ class Ext2Filesystem(object):
         maxBlocks = self._superblock.numBlocks - ((self._superblock.numBlockGroups - 1) * self._superblock.numBlocksPerGroup) - self._superblock.firstDataBlockId
         maxInodes = self._superblock.numInodes - ((self._superblock.numBlockGroups - 1) * self._superblock.numInodesPerGroup)
         
-      for i in range(self.blockSize):
-        for j in range(8):
-          if index < maxBlocks and (1 << j) & blockBitmap[i] != 0:
-            usedBlockCount += 1
-          if index < maxInodes and (1 << j) & inodeBitmap[i] != 0:
-            usedInodeCount += 1
-            inodeNum = (entryNum * self._superblock.numInodesPerGroup) + (i * 8) + j + 1
-            inode = self._readInode(inodeNum)
-            if (inode.mode & 0x4000) == 0x4000:
-              dirCount += 1
-          index += 1
+      usedBlockCount = bisect_left(_getSetBits(blockBitmap), maxBlocks)
+      for j in _getSetBits(inodeBitmap):
+        if j >= maxInodes:
+          break
+        usedInodeCount += 1
+        inodeNum = (entryNum * self._superblock.numInodesPerGroup) + j + 1
+        inode = self._readInode(inodeNum)
+        if (inode.mode & 0x4000) == 0x4000:
+          dirCount += 1
 
 
       if dirCount != entry.numInodesAsDirs:
@@ -504,90 +647,129 @@ class Ext2Filesystem(object):
     """Returns a list of all used inode numbers, excluding those reserved by the
     filesystem."""
     used = []
-    bitmaps = []
-    for bgdtEntry in self._bgdt.entries:
-      bitmapStartPos = bgdtEntry.inodeBitmapLocation * self._superblock.blockSize
-      bitmapSize = self._superblock.numInodesPerGroup / 8
-      bitmapBytes = self._device.read(bitmapStartPos, bitmapSize)
-      if len(bitmapBytes) < bitmapSize:
-        raise FilesystemError("Invalid inode bitmap.")
-      bitmaps.append(unpack("{0}B".format(bitmapSize), bitmapBytes))
+    numInodesPerGroup = self._superblock.numInodesPerGroup
+    bitmaps = self.__readBitmaps([e.inodeBitmapLocation for e in self._bgdt.entries], numInodesPerGroup // 8)
     
     for groupNum,bitmap in enumerate(bitmaps):
-      for byteIndex, byte in enumerate(bitmap):
-        if byte != 0:
-          for i in range(8):
-            if (1 << i) & byte != 0:
-              inum = (groupNum * self._superblock.numInodesPerGroup) + (byteIndex * 8) + i + 1
-              if inum >= self._superblock.firstInode:
-                used.append(inum)
+      groupStart = (groupNum * numInodesPerGroup) + 1
+      used.extend(groupStart + i for i in _getSetBits(bitmap))
     
+    # the numbers are in ascending order, so the reserved inodes are all at the front
+    del used[:bisect_left(used, self._superblock.firstInode)]
     return used
   
   
   
+  def __readBitmaps(self, bids, bitmapSize):
+    """Reads the bitmaps of the specified size starting at each of the specified block ids and
+    returns them as a list of byte arrays. All of the bitmaps are hinted to the device before the
+    first is read, so that they may be paged in together."""
+    blockSize = self._superblock.blockSize
+    positions = [bid * blockSize for bid in bids]
+    for pos in positions:
+      self._device.advise(pos, bitmapSize, "willneed")
+    return [bytearray(self._device.read(pos, bitmapSize)) for pos in positions]
+  
+  
+  
   def __getUsedBlocks(self):
     """Returns a list off all block ids currently in use by the filesystem."""
     used = []
-    bitmaps = []
-    for bgdtEntry in self._bgdt.entries:
-      bitmapStartPos = bgdtEntry.blockBitmapLocation * self._superblock.blockSize
-      bitmapSize = self._superblock.numBlocksPerGroup / 8
-      bitmapBytes = self._device.read(bitmapStartPos, bitmapSize)
-      if len(bitmapBytes) < bitmapSize:
-        raise FilesystemError("Invalid block bitmap.")
-      bitmaps.append(unpack("{0}B".format(bitmapSize), bitmapBytes))
+    numBlocksPerGroup = self._superblock.numBlocksPerGroup
+    firstDataBlockId = self._superblock.firstDataBlockId
+    bitmaps = self.__readBitmaps([e.blockBitmapLocation for e in self._bgdt.entries], numBlocksPerGroup // 8)
         
     for groupNum,bitmap in enumerate(bitmaps):
-      for byteIndex, byte in enumerate(bitmap):
-        if byte != 0:
-          for i in range(8):
-            if (1 << i) & byte != 0:
-              bid = (groupNum * self._superblock.numBlocksPerGroup) + (byteIndex * 8) + i + self._superblock.firstDataBlockId
-              used.append(bid)
+      groupStart = (groupNum * numBlocksPerGroup) + firstDataBlockId
+      used.extend(groupStart + i for i in _getSetBits(bitmap))
     
     return used
     
   
   
   
+  def _readBlocks(self, bids):
+    """Reads the blocks specified by the given list of block ids and returns a list of their byte
+    strings in the same order. Each run of consecutive block ids is read from the device at once."""
+    blockSize = self._superblock.blockSize
+    blocks = []
+    i = 0
+    while i < len(bids):
+      runStart = i
+      i += 1
+      while i < len(bids) and bids[i] == bids[i-1] + 1:
+        i += 1
+      runBytes = self._readBlock(bids[runStart], 0, (i - runStart) * blockSize)
+      for j in range(0, len(runBytes), blockSize):
+        blocks.append(runBytes[j:j+blockSize])
+    return blocks
+  
+  
+  
   def _readBlock(self, bid, offset = 0, count = None):
     """Reads from the block specified by the given block id and returns a string of bytes."""
+    blockSize = self._superblock.blockSize
     if not count:
-      count = self._superblock.blockSize
-    block = self._device.read(bid * self._superblock.blockSize + offset, count)
-    if len(block) < count:
-      raise FilesystemError("Invalid block.")
-    return block
+      count = blockSize
+    return self._device.read(bid * blockSize + offset, count)
+
+
+
+  def _readBidList(self, bid):
+    """Reads the block of block ids at the specified block id and returns the ids as an array. Lists
+    are cached in least-recently-used order, so an indirect block is not unpacked again for each
+    block looked up through it."""
+    with self._cacheLock:
+      bids = self._bidListCache.pop(bid, None)
+      if bids is None:
+        bids = _unpackBidList(self._readBlock(bid))
+      if len(self._bidListCache) >= self.maxCachedBidLists:
+        self._bidListCache.popitem(False)
+      self._bidListCache[bid] = bids
+      return bids
+
+
+
+  def _writeToBidList(self, listBid, listIndex, bid):
+    """Writes the specified block id at the given index of the block of block ids at listBid, and
+    updates the cached list if there is one."""
+    self._writeToBlock(listBid, listIndex * 4, pack("<I", bid))
+    with self._cacheLock:
+      bids = self._bidListCache.get(listBid)
+      if not bids is None:
+        bids[listIndex] = bid
 
 
 
   def _freeBlock(self, bid):
     """Frees the block specified by the given block id."""
-    groupNum = (bid - self._superblock.firstDataBlockId) / self._superblock.numBlocksPerGroup
-    indexInGroup = (bid - self._superblock.firstDataBlockId) % self._superblock.numBlocksPerGroup
-    byteIndex = indexInGroup / 8
-    bitIndex = indexInGroup % 8
+    groupNum, indexInGroup = divmod(bid - self._superblock.firstDataBlockId, self._superblock.numBlocksPerGroup)
+    byteIndex = indexInGroup >> 3
+    bitIndex = indexInGroup & 0x07
 
     bgdtEntry = self._bgdt.entries[groupNum]
     bitmapStartPos = bgdtEntry.blockBitmapLocation * self._superblock.blockSize
-    byte = unpack("B", self._device.read(bitmapStartPos + byteIndex, 1))[0]
+    byte = ord(self._device.read(bitmapStartPos + byteIndex, 1))
     self._device.write(bitmapStartPos + byteIndex, pack("B", int(byte) & ~(1 << bitIndex)))
     self._superblock.numFreeBlocks += 1
     bgdtEntry.numFreeBlocks += 1
+    with self._cacheLock:
+      self._bidListCache.pop(bid, None)
 
 
 
   def _allocateBlock(self, zeros = False):
     """Allocates the first free block and returns its id."""
-    bitmapSize = self._superblock.numBlocksPerGroup / 8
+    blockSize = self._superblock.blockSize
+    numBlocksPerGroup = self._superblock.numBlocksPerGroup
+    bitmapSize = numBlocksPerGroup // 8
     bitmapStartPos = None
     bgdtEntry = None
     groupNum = 0
     
     for groupNum, bgdtEntry in enumerate(self._bgdt.entries):
       if bgdtEntry.numFreeBlocks > 0:
-        bitmapStartPos = bgdtEntry.blockBitmapLocation * self._superblock.blockSize
+        bitmapStartPos = bgdtEntry.blockBitmapLocation * blockSize
         break
     if bitmapStartPos is None:
       raise FilesystemError("No free blocks.")
@@ -595,45 +777,61 @@ class Ext2Filesystem(object):
     bitmapBytes = self._device.read(bitmapStartPos, bitmapSize)
     if len(bitmapBytes) < bitmapSize:
       raise FilesystemError("Invalid block bitmap.")
-    bitmap = unpack("<{0}B".format(bitmapSize), bitmapBytes)
-
-    for byteIndex, byte in enumerate(bitmap):
-      if byte != 255:
-        for i in range(8):
-          if (1 << i) & byte == 0:
-            bid = (groupNum * self._superblock.numBlocksPerGroup) + (byteIndex * 8) + i + self._superblock.firstDataBlockId
-            self._device.write(bitmapStartPos + byteIndex, pack("B", byte | (1 << i)))
-            self._superblock.numFreeBlocks -= 1
-            bgdtEntry.numFreeBlocks -= 1
-            if zeros:
-              start = bid * self._superblock.blockSize
-              zeros = [0] * self._superblock.blockSize
-              fmt = ["B"] * self._superblock.blockSize
-              self._device.write(start, "".join(map(pack, fmt, zeros)))
-            self._superblock.timeLastWrite = int(time())
-            return bid
+    bitmap = bytearray(bitmapBytes)
+
+    bitIndex = _findClearBit(bitmap)
+    if bitIndex is None:
+      raise FilesystemError("No free blocks.")
     
-    raise FilesystemError("No free blocks.")
+    byteIndex = bitIndex >> 3
+    bid = (groupNum * numBlocksPerGroup) + bitIndex + self._superblock.firstDataBlockId
+    self._device.write(bitmapStartPos + byteIndex, pack("B", bitmap[byteIndex] | (1 << (bitIndex & 0x07))))
+    self._superblock.numFreeBlocks -= 1
+    bgdtEntry.numFreeBlocks -= 1
+    if zeros:
+      self._device.write(bid * blockSize, b"\0" * blockSize)
+    self._superblock.timeLastWrite = int(time())
+    return bid
   
   
   
   def _writeToBlock(self, bid, offset, byteString):
     """Writes the specified byte string to the specified block id at the given offset within the block."""
-    assert offset + len(byteString) <= self._superblock.blockSize, "Byte array does not fit within block."
-    self._device.write(offset + bid * self._superblock.blockSize, byteString)
+    blockSize = self._superblock.blockSize
+    assert offset + len(byteString) <= blockSize, "Byte array does not fit within block."
+    self._device.write(offset + bid * blockSize, byteString)
     self._superblock.timeLastWrite = int(time())
     
   
   
   def _readInode(self, inodeNum):
-    """Reads the specified inode number and returns the inode object."""
-    return _Inode.read(inodeNum, self._bgdt, self._superblock, self)
+    """Reads the specified inode number and returns the inode object. Inode objects are cached in
+    least-recently-used order, so files opened through the same inode share its object."""
+    with self._cacheLock:
+      inode = self._inodeCache.pop(inodeNum, None)
+      if inode is None:
+        inode = _Inode.read(inodeNum, self._bgdt, self._superblock, self)
+      self.__cacheInode(inode)
+      return inode
   
   
   
   def _allocateInode(self, mode, uid, gid, creationTime, modTime, accessTime):
     """Allocates a new inode and returns the inode object."""
-    return _Inode.new(self._bgdt, self._superblock, self, mode, uid, gid, creationTime, modTime, accessTime)
+    inode = _Inode.new(self._bgdt, self._superblock, self, mode, uid, gid, creationTime, modTime, accessTime)
+    with self._cacheLock:
+      self._inodeCache.pop(inode.number, None)
+      self.__cacheInode(inode)
+    return inode
+  
+  
+  
+  def __cacheInode(self, inode):
+    """Caches the specified inode object as the most recently used. The caller holds the cache
+    lock."""
+    if len(self._inodeCache) >= self.maxCachedInodes:
+      self._inodeCache.popitem(False)
+    self._inodeCache[inode.number] = inode
 
 
 
@@ -6,15 +6,82 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
-from struct import pack, unpack, unpack_from
+import sys
+from array import array
+from struct import pack, unpack_from, Struct
 from time import time
-from math import ceil
 from ..error import FilesystemError
+from .bitmap import _findClearBit
+
+
+# precompiled layouts of the inode fields for each revision and of the OS dependent fields
+_FIELDS_REV0 = Struct("<2Hi4IHh2I4x15I")
+_FIELDS_REV1 = Struct("<2H5IHh2I4x15I8xI")
+_OS_FIELDS = Struct("<2x3H")
+
+# precompiled layout of the leading fields written when a new inode is allocated
+_NEW_FIELDS = Struct("<2Hi4IH")
+
+# precompiled layouts of the single fields written back by the setters and block assignments
+_UINT8 = Struct("B")
+_INT16 = Struct("<h")
+_UINT16 = Struct("<H")
+_UINT32 = Struct("<I")
+
+# whether the high bits of the mode are stored in the OS dependent fields, keyed by the id of each
+# creator OS that stores the high bits of the uid and gid there; Linux (0) leaves the mode field
+# reserved while Hurd (1) uses it
+_OS_HAS_HIGH_MODE = {0: False, 1: True}
+
+# limits of each level of block addressing, keyed by block size
+_blockAddressLimits = {}
+
+def _getBlockAddressLimits(blockSize):
+  """Gets the number of block ids per block and its square, followed by the number of blocks
+  addressable through the direct, indirect, doubly indirect and trebly indirect block ids of an
+  inode."""
+  limits = _blockAddressLimits.get(blockSize)
+  if limits is None:
+    numIdsPerBlock = blockSize // 4
+    numIdsPerBlockSq = numIdsPerBlock * numIdsPerBlock
+    numDirectBlocks = 12
+    numIndirectBlocks = numDirectBlocks + numIdsPerBlock
+    numDoublyIndirectBlocks = numIndirectBlocks + numIdsPerBlockSq
+    numTreblyIndirectBlocks = numDoublyIndirectBlocks + numIdsPerBlockSq * numIdsPerBlock
+    limits = _blockAddressLimits[blockSize] = (numIdsPerBlock, numIdsPerBlockSq, numDirectBlocks,
+                                               numIndirectBlocks, numDoublyIndirectBlocks,
+                                               numTreblyIndirectBlocks)
+  return limits
+
+def _getUsedIds(bids):
+  """Returns the block ids in the specified list that precede the first unused (zero) id. The
+  zero is found by a single search rather than by testing each id in turn."""
+  try:
+    return bids[:bids.index(0)]
+  except ValueError:
+    return bids
+
+# type of the arrays holding block ids, an unsigned int being 32 bits wide on supported platforms
+_BID_TYPECODE = "I"
+
+def _unpackBidList(byteString):
+  """Unpacks the little-endian block ids in the specified bytes into an array of unsigned ints,
+  which copies the bytes once without making an object for each id."""
+  bids = array(_BID_TYPECODE, byteString)
+  if sys.byteorder == "big":
+    bids.byteswap()
+  return bids
 
 
 class _Inode(object):
   """Models an inode on the Ext2 fileystem. For internal use only."""
 
+  __slots__ = ("_bgdtEntry", "_tableBid", "_fs", "_superblock", "_inodeTableOffset", "_num", "_used",
+               "_mode", "_uid", "_size", "_timeAccessed", "_timeCreated", "_timeModified", "_timeDeleted",
+               "_gid", "_numLinks", "_flags", "_numDataBlocks", "_blocks", "_numIdsPerBlock",
+               "_numIdsPerBlockSq", "_numDirectBlocks", "_numIndirectBlocks", "_numDoublyIndirectBlocks",
+               "_numTreblyIndirectBlocks", "_isRev0", "_hasHighMode")
+
 
   @property
   def number(self):
@@ -23,7 +90,12 @@ class _Inode(object):
 
   @property
   def isUsed(self):
-    """Returns True if the inode is marked as used, False otherwise."""
+    """Returns True if the inode is marked as used, False otherwise. The inode bitmap is
+    only consulted the first time this is asked of an inode that was read from disk."""
+    if self._used is None:
+      indexInGroup = (self._num - 1) % self._superblock.numInodesPerGroup
+      bitmapByte = ord(self._fs._readBlock(self._bgdtEntry.inodeBitmapLocation, indexInGroup >> 3, 1))
+      self._used = (bitmapByte & (1 << (indexInGroup & 0x07)) != 0)
     return self._used
 
   @property
@@ -49,7 +121,7 @@ class _Inode(object):
   @property
   def numDataBlocks(self):
     """Gets the number of blocks used for only data inside the inode."""
-    return int(ceil(float(self._size) / self._superblock.blockSize))
+    return -(-self._size // self._superblock.blockSize)
 
   @property
   def mode(self):
@@ -59,9 +131,9 @@ class _Inode(object):
   def mode(self, value):
     """Sets the mode bitmap."""
     self._mode = value
-    self.__writeData(0, pack("<H", (self._mode & 0xFFFF)))
-    if self._superblock.creatorOS == "HURD":
-      self.__writeData(118, pack("<H", (self._mode >> 16)))
+    self.__writeData(0, _UINT16.pack(self._mode & 0xFFFF))
+    if self._hasHighMode:
+      self.__writeData(118, _UINT16.pack(self._mode >> 16))
 
   @property
   def uid(self):
@@ -71,9 +143,9 @@ class _Inode(object):
   def uid(self, value):
     """Sets the uid of the inode's owner."""
     self._uid = value
-    self.__writeData(2, pack("<H", (self._uid & 0xFFFF)))
-    if self._superblock.creatorOS == "LINUX" or self._superblock.creatorOS == "HURD":
-      self.__writeData(120, pack("<H", (self._uid >> 16)))
+    self.__writeData(2, _UINT16.pack(self._uid & 0xFFFF))
+    if not self._hasHighMode is None:
+      self.__writeData(120, _UINT16.pack(self._uid >> 16))
 
   @property
   def size(self):
@@ -83,10 +155,10 @@ class _Inode(object):
   def size(self, value):
     """Sets the size in bytes of the inode's file."""
     self._size = value
-    self.__writeData(4, pack("<I", (self._size & 0xFFFFFFFF)))
+    self.__writeData(4, _UINT32.pack(self._size & 0xFFFFFFFF))
     # if regular file on revision > 0, save upper 32 bits of size in dir ACL field
-    if self._superblock.revisionMajor > 0 and (self._mode & 0x8000) != 0:
-      self.__writeData(108, pack("<I", (self._size >> 32)))
+    if not self._isRev0 and (self._mode & 0x8000) != 0:
+      self.__writeData(108, _UINT32.pack(self._size >> 32))
 
   @property
   def timeAccessed(self):
@@ -96,7 +168,7 @@ class _Inode(object):
   def timeAccessed(self, value):
     """Sets the time the inode was last accessed."""
     self._timeAccessed = value
-    self.__writeData(8, pack("<I", self._timeAccessed))
+    self.__writeData(8, _UINT32.pack(self._timeAccessed))
 
   @property
   def timeModified(self):
@@ -106,7 +178,7 @@ class _Inode(object):
   def timeModified(self, value):
     """Sets the time the inode was last modified."""
     self._timeModified = value
-    self.__writeData(16, pack("<I", self._timeModified))
+    self.__writeData(16, _UINT32.pack(self._timeModified))
 
   @property
   def timeDeleted(self):
@@ -116,7 +188,7 @@ class _Inode(object):
   def timeDeleted(self, value):
     """Sets the time the inode was deleted."""
     self._timeDeleted = value
-    self.__writeData(20, pack("<I", self._timeDeleted))
+    self.__writeData(20, _UINT32.pack(self._timeDeleted))
 
   @property
   def gid(self):
@@ -126,9 +198,9 @@ class _Inode(object):
   def gid(self, value):
     """Sets the gid of the inode's owner."""
     self._gid = value
-    self.__writeData(24, pack("<H", (self._gid & 0xFFFF)))
-    if self._superblock.creatorOS == "LINUX" or self._superblock.creatorOS == "HURD":
-      self.__writeData(122, pack("<H", (self._gid >> 16)))
+    self.__writeData(24, _UINT16.pack(self._gid & 0xFFFF))
+    if not self._hasHighMode is None:
+      self.__writeData(122, _UINT16.pack(self._gid >> 16))
 
   @property
   def numLinks(self):
@@ -138,7 +210,7 @@ class _Inode(object):
   def numLinks(self, value):
     """Sets the number of hard links to the inode."""
     self._numLinks = value
-    self.__writeData(26, pack("<h", self._numLinks))
+    self.__writeData(26, _INT16.pack(self._numLinks))
 
 
 
@@ -150,7 +222,7 @@ class _Inode(object):
     
     bgroupNum = 0
     bgdtEntry = None
-    bitmapSize = superblock.numInodesPerGroup / 8
+    bitmapSize = superblock.numInodesPerGroup // 8
 
     for bgroupNum, bgdtEntry in enumerate(bgdt.entries):
       if bgdtEntry.numFreeInodes > 0:
@@ -162,22 +234,15 @@ class _Inode(object):
     if len(bitmapBytes) < bitmapSize:
       raise FilesystemError("Invalid inode bitmap.")
 
-    
-    def getAndMarkInode(bitmap):
-      for byteIndex, byte in enumerate(bitmap):
-        if byte != 255:
-          for i in range(8):
-            if (1 << i) & byte == 0:
-              inodeNum = (bgroupNum * superblock.numInodesPerGroup) + (byteIndex * 8) + i + 1
-              if inodeNum < superblock.firstInode:
-                continue
-              fs._writeToBlock(bgdtEntry.inodeBitmapLocation, byteIndex, pack("B", byte | (1 << i)))
-              return inodeNum
-      return None
-
-    inodeNum = getAndMarkInode(unpack("{0}B".format(bitmapSize), bitmapBytes))
-    if inodeNum is None:
+    # the inodes reserved by the filesystem are never allocated, so the search starts after them
+    bitmap = bytearray(bitmapBytes)
+    groupStart = bgroupNum * superblock.numInodesPerGroup
+    bitIndex = _findClearBit(bitmap, max(superblock.firstInode - 1 - groupStart, 0))
+    if bitIndex is None:
       raise FilesystemError("No free inodes.")
+    byteIndex = bitIndex >> 3
+    fs._writeToBlock(bgdtEntry.inodeBitmapLocation, byteIndex, _UINT8.pack(bitmap[byteIndex] | (1 << (bitIndex & 0x07))))
+    inodeNum = groupStart + bitIndex + 1
 
     superblock.numFreeInodes -= 1
     bgdtEntry.numFreeInodes -= 1
@@ -185,20 +250,19 @@ class _Inode(object):
       bgdtEntry.numInodesAsDirs += 1
 
 
-    if superblock.creatorOS == "LINUX":
-      osdBytes = pack("<4x2H", (uid >> 16), (gid >> 16))
-    elif superblock.creatorOS == "HURD":
-      osdBytes = pack("<2x3H", (mode >> 16), (uid >> 16), (gid >> 16))
-    else:
-      osdBytes = pack("<12x")
-    
-    inodeBytes = pack("<2Hi4IH90x12s", (mode & 0xFFFF), (uid & 0xFFFF), 0, accessTime, creationTime, modTime, 0,
-      (gid & 0xFFFF), osdBytes)
+    # the fields are packed in place into a zeroed inode, with the high bits of the ids in the
+    # OS dependent fields laid out as they are read back
+    inodeBytes = bytearray(128)
+    _NEW_FIELDS.pack_into(inodeBytes, 0, (mode & 0xFFFF), (uid & 0xFFFF), 0, accessTime, creationTime, modTime, 0,
+      (gid & 0xFFFF))
+    hasHighMode = _OS_HAS_HIGH_MODE.get(superblock.creatorOSId)
+    if not hasHighMode is None:
+      _OS_FIELDS.pack_into(inodeBytes, 116, (mode >> 16) if hasHighMode else 0, (uid >> 16), (gid >> 16))
     
     # write new inode bytes to the device
     bgroupIndex = (inodeNum - 1) % superblock.numInodesPerGroup
-    tableBid = bgdtEntry.inodeTableLocation + (bgroupIndex * superblock.inodeSize) / fs.blockSize
-    inodeTableOffset = (bgroupIndex * superblock.inodeSize) % fs.blockSize
+    tableIndex, inodeTableOffset = divmod(bgroupIndex * superblock.inodeSize, superblock.blockSize)
+    tableBid = bgdtEntry.inodeTableLocation + tableIndex
     fs._writeToBlock(tableBid, inodeTableOffset, inodeBytes)
 
     return cls(tableBid, inodeTableOffset, inodeBytes, True, inodeNum, bgdtEntry, superblock, fs)
@@ -209,21 +273,17 @@ class _Inode(object):
   def read(cls, inodeNum, bgdt, superblock, fs):
     """Reads the inode with the specified inode number and returns the new object."""
 
-    bgroupNum = (inodeNum - 1) / superblock.numInodesPerGroup
-    bgroupIndex = (inodeNum - 1) % superblock.numInodesPerGroup
+    inodeSize = superblock.inodeSize
+    bgroupNum, bgroupIndex = divmod(inodeNum - 1, superblock.numInodesPerGroup)
     bgdtEntry = bgdt.entries[bgroupNum]
 
-    bitmapByteIndex = bgroupIndex / 8
-    tableBid = bgdtEntry.inodeTableLocation + (bgroupIndex * superblock.inodeSize) / fs.blockSize
-    inodeTableOffset = (bgroupIndex * superblock.inodeSize) % fs.blockSize
+    tableIndex, inodeTableOffset = divmod(bgroupIndex * inodeSize, superblock.blockSize)
+    tableBid = bgdtEntry.inodeTableLocation + tableIndex
     
-    bitmapByte = unpack("B", fs._readBlock(bgdtEntry.inodeBitmapLocation, bitmapByteIndex, 1))[0]
-    inodeBytes = fs._readBlock(tableBid, inodeTableOffset, superblock.inodeSize)
-    if len(inodeBytes) < superblock.inodeSize:
-      raise FilesystemError("Invalid inode.")
-
-    isUsed = (bitmapByte & (1 << (bgroupIndex % 8)) != 0)
-    return cls(tableBid, inodeTableOffset, inodeBytes, isUsed, inodeNum, bgdtEntry, superblock, fs)
+    # whether the inode is used is left to be read from the bitmap on demand, so that
+    # reading an inode takes a single read from the device
+    inodeBytes = fs._readBlock(tableBid, inodeTableOffset, inodeSize)
+    return cls(tableBid, inodeTableOffset, inodeBytes, None, inodeNum, bgdtEntry, superblock, fs)
 
 
 
@@ -236,58 +296,42 @@ class _Inode(object):
     self._superblock = superblock
     self._inodeTableOffset = inodeTableOffset
     
-    if superblock.revisionMajor == 0:
-      fields = unpack_from("<2Hi4IHh2I4x15I", inodeBytes)
+    # the revision and creator OS decide which fields are read here and written by the setters
+    self._isRev0 = isRev0 = (superblock.revisionMajor == 0)
+    if isRev0:
+      fields = _FIELDS_REV0.unpack_from(inodeBytes)
     else:
-      fields = unpack_from("<2H5IHh2I4x15I8xI", inodeBytes)
+      fields = _FIELDS_REV1.unpack_from(inodeBytes)
 
-    osFields = []
-    if superblock.creatorOS == "LINUX":
-      osFields = unpack_from("<4x2H", inodeBytes, 116)
-    elif superblock.creatorOS == "HURD":
-      osFields = unpack_from("<2x3H", inodeBytes, 116)
+    self._hasHighMode = hasHighMode = _OS_HAS_HIGH_MODE.get(superblock.creatorOSId)
       
     self._num = inodeNum
     self._used = isUsed
-    self._mode = fields[0]
-    self._uid = fields[1]
-    self._size = fields[2]
-    self._timeAccessed = fields[3]
-    self._timeCreated = fields[4]
-    self._timeModified = fields[5]
-    self._timeDeleted = fields[6]
-    self._gid = fields[7]
-    self._numLinks = fields[8]
-    self._numDataBlocks = fields[9] / (2 << self._superblock.logBlockSize)
-    self._flags = fields[10]
-    self._blocks = []
-    for i in range(15):
-      self._blocks.append(fields[11+i])
-    if superblock.revisionMajor > 0:
+    (self._mode, self._uid, self._size, self._timeAccessed, self._timeCreated, self._timeModified,
+     self._timeDeleted, self._gid, self._numLinks, numSectors, self._flags) = fields[:11]
+    self._numDataBlocks = numSectors // (2 << superblock.logBlockSize)
+    self._blocks = array(_BID_TYPECODE, fields[11:26])
+    if not isRev0:
       self._size |= (fields[26] << 32)
-    if superblock.creatorOS == "LINUX":
-      self._uid |= (osFields[0] << 16)
-      self._gid |= (osFields[1] << 16)
-    elif superblock.creatorOS == "HURD":
-      self._mode |= (osFields[0] << 16)
+    if not hasHighMode is None:
+      osFields = _OS_FIELDS.unpack_from(inodeBytes, 116)
+      if hasHighMode:
+        self._mode |= (osFields[0] << 16)
       self._uid |= (osFields[1] << 16)
       self._gid |= (osFields[2] << 16)
 
-    self._numIdsPerBlock = self._superblock.blockSize / 4
-    self._numDirectBlocks = 12
-    self._numIndirectBlocks = self._numDirectBlocks + self._numIdsPerBlock
-    self._numDoublyIndirectBlocks = self._numIndirectBlocks + self._numIdsPerBlock ** 2
-    self._numTreblyIndirectBlocks = self._numDoublyIndirectBlocks + self._numIdsPerBlock ** 3
+    (self._numIdsPerBlock, self._numIdsPerBlockSq, self._numDirectBlocks, self._numIndirectBlocks,
+     self._numDoublyIndirectBlocks, self._numTreblyIndirectBlocks) = _getBlockAddressLimits(superblock.blockSize)
 
 
   def free(self):
     """Frees this inode so that it can be reused. All referenced blocks should be freed before calling."""
-    indexInGroup = (self.number - 1) % self._superblock.numInodesPerGroup
-    byteIndex = indexInGroup / 8
-    bitIndex = indexInGroup % 8
+    indexInGroup = (self._num - 1) % self._superblock.numInodesPerGroup
+    byteIndex = indexInGroup >> 3
+    bitIndex = indexInGroup & 0x07
     
-    byte = unpack("B", self._fs._readBlock(self._bgdtEntry.inodeBitmapLocation, byteIndex, 1))[0]
-    self._fs._writeToBlock(self._bgdtEntry.inodeBitmapLocation, byteIndex, pack("B", int(byte) & ~(1 << bitIndex)))
+    byte = ord(self._fs._readBlock(self._bgdtEntry.inodeBitmapLocation, byteIndex, 1))
+    self._fs._writeToBlock(self._bgdtEntry.inodeBitmapLocation, byteIndex, _UINT8.pack(int(byte) & ~(1 << bitIndex)))
     self._superblock.numFreeInodes += 1
     self._bgdtEntry.numFreeInodes += 1
     if (self.mode & 0x4000) != 0:
@@ -301,48 +345,31 @@ class _Inode(object):
     """Generates a list of all block ids in use by the inode, including data
     and indirect blocks."""
     
+    blocks = self._blocks
+    
     # get direct blocks
-    for i in range(12):
-      bid = self.blocks[i]
-      if bid == 0:
-        break
-      yield bid
+    yield from _getUsedIds(blocks[:12])
 
     # get indirect blocks
-    if self.blocks[12] != 0:
-      for bid in self.__getBidListAtBid(self.blocks[12]):
-        if bid == 0:
-          break
-        yield bid
-      yield self.blocks[12]
+    if blocks[12] != 0:
+      yield from _getUsedIds(self.__getBidListAtBid(blocks[12]))
+      yield blocks[12]
 
     # get doubly indirect blocks
-    if self.blocks[13] != 0:
-      for indirectBid in self.__getBidListAtBid(self.blocks[13]):
-        if indirectBid == 0:
-          break
-        for bid in self.__getBidListAtBid(indirectBid):
-          if bid == 0:
-            break
-          yield bid
+    if blocks[13] != 0:
+      for indirectBid in _getUsedIds(self.__getBidListAtBid(blocks[13])):
+        yield from _getUsedIds(self.__getBidListAtBid(indirectBid))
         yield indirectBid
-      yield self.blocks[13]
+      yield blocks[13]
 
     # get trebly indirect blocks
-    if self.blocks[14] != 0:
-      for doublyIndirectBid in self.__getBidListAtBid(self.blocks[14]):
-        if doublyIndirectBid == 0:
-          break
-        for indirectBid in self.__getBidListAtBid(doublyIndirectBid):
-          if indirectBid == 0:
-            break
-          for bid in self.__getBidListAtBid(indirectBid):
-            if bid == 0:
-              break
-            yield bid
+    if blocks[14] != 0:
+      for doublyIndirectBid in _getUsedIds(self.__getBidListAtBid(blocks[14])):
+        for indirectBid in _getUsedIds(self.__getBidListAtBid(doublyIndirectBid)):
+          yield from _getUsedIds(self.__getBidListAtBid(indirectBid))
           yield indirectBid
         yield doublyIndirectBid
-      yield self.blocks[14]
+      yield blocks[14]
 
 
 
@@ -365,15 +392,15 @@ class _Inode(object):
       elif index < self._numDoublyIndirectBlocks:
         indirectList = self.__getBidListAtBid(self.blocks[13])
         index -= self._numIndirectBlocks # get index from start of doubly indirect list
-        directList = self.__getBidListAtBid(indirectList[index / self._numIdsPerBlock])
+        directList = self.__getBidListAtBid(indirectList[index // self._numIdsPerBlock])
         return directList[index % self._numIdsPerBlock]
 
       elif index < self._numTreblyIndirectBlocks:
         doublyIndirectList = self.__getBidListAtBid(self.blocks[14])
         index -= self._numDoublyIndirectBlocks # get index from start of trebly indirect list
-        indirectList = self.__getBidListAtBid(doublyIndirectList[index / (self._numIdsPerBlock ** 2)])
-        index %= (self._numIdsPerBlock ** 2) # get index from start of indirect list
-        directList = self.__getBidListAtBid(indirectList[index / self._numIdsPerBlock])
+        indirectList = self.__getBidListAtBid(doublyIndirectList[index // self._numIdsPerBlockSq])
+        index %= self._numIdsPerBlockSq # get index from start of indirect list
+        directList = self.__getBidListAtBid(indirectList[index // self._numIdsPerBlock])
         return directList[index % self._numIdsPerBlock]
       
       return 0
@@ -386,7 +413,7 @@ class _Inode(object):
     """Assigns the specified string to the block data."""
     pathBytes = pack("<{0}s{1}x".format(len(path), 60 - len(path)), path)
     self.__writeData(40, pathBytes)
-    self._blocks = list(unpack_from("<15I", pathBytes))
+    self._blocks = _unpackBidList(pathBytes)
 
 
   def getStringFromBlocks(self):
@@ -401,9 +428,9 @@ class _Inode(object):
     
     if self._numDataBlocks < self._numDirectBlocks:
       self._blocks[self._numDataBlocks] = bid
-      self.__writeData(40+(self._numDataBlocks*4), pack("<I", bid))
+      self.__writeData(40+(self._numDataBlocks*4), _UINT32.pack(bid))
       self._numDataBlocks += 1
-      self.__writeData(28, pack("<I", self._numDataBlocks * (2 << self._superblock.logBlockSize)))
+      self.__writeData(28, _UINT32.pack(self._numDataBlocks * (2 << self._superblock.logBlockSize)))
       return self._numDataBlocks
     
 
@@ -411,10 +438,10 @@ class _Inode(object):
       if self.blocks[12] == 0:
         self.blocks[12] = self._fs._allocateBlock(True)
         self._numDataBlocks += 1
-        self.__writeData(88, pack("<I", self.blocks[12]))
+        self.__writeData(88, _UINT32.pack(self.blocks[12]))
       self.__writeToBidListAtBid(self.blocks[12], self._numDataBlocks - self._numDirectBlocks - 1, bid)
       self._numDataBlocks += 1
-      self.__writeData(28, pack("<I", self._numDataBlocks * (2 << self._superblock.logBlockSize)))
+      self.__writeData(28, _UINT32.pack(self._numDataBlocks * (2 << self._superblock.logBlockSize)))
       return self._numDataBlocks
 
 
@@ -422,11 +449,11 @@ class _Inode(object):
       if self.blocks[13] == 0:
         self.blocks[13] = self._fs._allocateBlock(True)
         self._numDataBlocks += 1
-        self.__writeData(92, pack("<I", self.blocks[13]))
+        self.__writeData(92, _UINT32.pack(self.blocks[13]))
       indirectList = self.__getBidListAtBid(self.blocks[13])
       
       index = self._numDataBlocks - self._numIndirectBlocks - 2
-      indirectIndex = index / (self._numIdsPerBlock + 1)
+      indirectIndex = index // (self._numIdsPerBlock + 1)
       directIndex = index % (self._numIdsPerBlock + 1) - 1
       
       if indirectList[indirectIndex] == 0:
@@ -439,7 +466,7 @@ class _Inode(object):
       directList[directIndex] = bid
       self.__writeToBidListAtBid(indirectList[indirectIndex], directIndex, directList[directIndex])
       self._numDataBlocks += 1
-      self.__writeData(28, pack("<I", self._numDataBlocks * (2 << self._superblock.logBlockSize)))
+      self.__writeData(28, _UINT32.pack(self._numDataBlocks * (2 << self._superblock.logBlockSize)))
       return self._numDataBlocks
 
 
@@ -448,13 +475,13 @@ class _Inode(object):
       if self.blocks[14] == 0:
         self.blocks[14] = self._fs._allocateBlock(True)
         self._numDataBlocks += 1
-        self.__writeData(96, pack("<I", self.blocks[14]))
+        self.__writeData(96, _UINT32.pack(self.blocks[14]))
         index += 1
       doublyIndirectList = self.__getBidListAtBid(self.blocks[14])
       
       
-      numDoublyIndirectBlocks = self._numIdsPerBlock ** 2 + self._numIdsPerBlock + 1
-      doublyIndirectIndex = index / numDoublyIndirectBlocks
+      numDoublyIndirectBlocks = self._numIdsPerBlockSq + self._numIdsPerBlock + 1
+      doublyIndirectIndex = index // numDoublyIndirectBlocks
       
       
       if doublyIndirectList[doublyIndirectIndex] == 0:
@@ -464,7 +491,7 @@ class _Inode(object):
         index += 1
       indirectList = self.__getBidListAtBid(doublyIndirectList[doublyIndirectIndex])
       
-      indirectIndex = ((index - numDoublyIndirectBlocks - 1) % numDoublyIndirectBlocks) / (self._numIdsPerBlock + 1)
+      indirectIndex = ((index - numDoublyIndirectBlocks - 1) % numDoublyIndirectBlocks) // (self._numIdsPerBlock + 1)
       
       if indirectList[indirectIndex] == 0:
         indirectList[indirectIndex] = self._fs._allocateBlock(True)
@@ -474,13 +501,13 @@ class _Inode(object):
       directList = self.__getBidListAtBid(indirectList[indirectIndex])
 
       overheadBlocks = (doublyIndirectIndex * self._numIdsPerBlock) + doublyIndirectIndex + indirectIndex + 2
-      dataBlocks = doublyIndirectIndex * self._numIdsPerBlock ** 2
+      dataBlocks = doublyIndirectIndex * self._numIdsPerBlockSq
       directIndex = (index - overheadBlocks - dataBlocks) % self._numIdsPerBlock
 
       directList[directIndex] = bid
       self.__writeToBidListAtBid(indirectList[indirectIndex], directIndex, directList[directIndex])
       self._numDataBlocks += 1
-      self.__writeData(28, pack("<I", self._numDataBlocks * (2 << self._superblock.logBlockSize)))
+      self.__writeData(28, _UINT32.pack(self._numDataBlocks * (2 << self._superblock.logBlockSize)))
       return self._numDataBlocks
 
 
@@ -488,12 +515,12 @@ class _Inode(object):
 
   def __getBidListAtBid(self, bid):
     """Reads and returns the list of block ids at the specified block id."""
-    return list(unpack_from("<{0}I".format(self._numIdsPerBlock), self._fs._readBlock(bid)))
+    return self._fs._readBidList(bid)
 
 
   def __writeToBidListAtBid(self, listBid, listIndex, bidToWrite):
     """Writes the specified block id to the list at the block id specified by listBid."""
-    self._fs._writeToBlock(listBid, listIndex * 4, pack("<I", bidToWrite))
+    self._fs._writeToBidList(listBid, listIndex, bidToWrite)
   
   
   def __writeData(self, offset, byteString):
@@ -6,11 +6,39 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2013, Michael R. Falcone"
 
 
-from struct import pack,unpack_from
-from math import ceil
+from struct import pack, Struct
 from ..error import FilesystemError
 
 
+# precompiled layouts of the standard and extended superblock fields
+_FIELDS = Struct("<7Ii5I6H4I2H")
+_EXTENDED_FIELDS = Struct("<I2H3I16s16s64sI2B2x16s3I4IB3x2I")
+
+# precompiled layouts of the counts, times and states written back by the setters
+_UINT16 = Struct("<H")
+_UINT32 = Struct("<I")
+
+# names of the values of the enumerated superblock fields, which are kept as read and only
+# named when asked for
+_STATES = {1: "VALID"}
+_ERROR_ACTIONS = {1: "CONTINUE", 2: "RO"}
+_CREATOR_OSES = {0: "LINUX", 1: "HURD", 2: "MASIX", 3: "FREEBSD", 4: "LITES"}
+
+
+def _getCopyBlockGroupIds(numBlockGroups):
+  """Gets the sorted ids of the block groups holding a copy of the superblock under the sparse
+  superblock feature: group 0, group 1 and the groups that are powers of 3, 5 and 7."""
+  groupIds = set([0])
+  if numBlockGroups > 1:
+    groupIds.add(1)
+    for base in (3, 5, 7):
+      power = base
+      while power < numBlockGroups:
+        groupIds.add(power)
+        power *= base
+  return sorted(groupIds)
+
+
 class _Superblock(object):
   """Provides access to the filesystem's superblock. For internal use only."""
   _saveCopies = False
@@ -79,7 +107,7 @@ class _Superblock(object):
   @property
   def errorAction(self):
     """Gets the action to take upon error."""
-    return self._errorAction
+    return _ERROR_ACTIONS.get(self._errorAction, "PANIC")
 
   @property
   def revisionMinor(self):
@@ -99,6 +127,11 @@ class _Superblock(object):
   @property
   def creatorOS(self):
     """Gets the name of the OS that created this filesystem."""
+    return _CREATOR_OSES.get(self._creatorOs, "UNDEFINED")
+
+  @property
+  def creatorOSId(self):
+    """Gets the numeric id of the OS that created this filesystem."""
     return self._creatorOs
 
   @property
@@ -236,7 +269,7 @@ class _Superblock(object):
   def numFreeBlocks(self, value):
     """Sets the number of free blocks."""
     self._numFreeBlocks = value
-    self.__writeData(12, pack("<I", self._numFreeBlocks))
+    self.__writeData(12, _UINT32.pack(self._numFreeBlocks))
 
   @property
   def numFreeInodes(self):
@@ -246,7 +279,7 @@ class _Superblock(object):
   def numFreeInodes(self, value):
     """Sets the number of free inodes."""
     self._numFreeInodes = value
-    self.__writeData(16, pack("<I", self._numFreeInodes))
+    self.__writeData(16, _UINT32.pack(self._numFreeInodes))
 
   @property
   def timeLastMount(self):
@@ -256,7 +289,7 @@ class _Superblock(object):
   def timeLastMount(self, value):
     """Sets the last mount time."""
     self._timeLastMount = value
-    self.__writeData(44, pack("<I", self._timeLastMount))
+    self.__writeData(44, _UINT32.pack(self._timeLastMount))
 
   @property
   def timeLastWrite(self):
@@ -265,8 +298,11 @@ class _Superblock(object):
   @timeLastWrite.setter
   def timeLastWrite(self, value):
     """Sets the time of last write access."""
+    # every write to the filesystem sets this, so it is only written out when the time changes
+    if value == self._timeLastWrite:
+      return
     self._timeLastWrite = value
-    self.__writeData(48, pack("<I", self._timeLastWrite))
+    self.__writeData(48, _UINT32.pack(self._timeLastWrite))
 
   @property
   def numMountsSinceCheck(self):
@@ -276,20 +312,18 @@ class _Superblock(object):
   def numMountsSinceCheck(self, value):
     """Sets the number of mounts since the last filesystem check."""
     self._numMountsSinceCheck = value
-    self.__writeData(52, pack("<H", self._numMountsSinceCheck))
+    self.__writeData(52, _UINT16.pack(self._numMountsSinceCheck))
 
   @property
   def state(self):
     """Gets the state of the filesystem as a string that is either VALID or ERROR."""
-    if self._state == 1:
-      return "VALID"
-    return "ERROR"
+    return _STATES.get(self._state, "ERROR")
   @state.setter
   def state(self, value):
     """Sets the state of the filesystem as 1 for VALID or 0 for ERROR."""
     float(value) # raise exception if not a number
     self._state = value
-    self.__writeData(58, pack("<H", self._state))
+    self.__writeData(58, _UINT16.pack(self._state))
 
   @property
   def volumeName(self):
@@ -298,10 +332,11 @@ class _Superblock(object):
   @volumeName.setter
   def volumeName(self, value):
     """Sets the name of the volume."""
-    if len(value) > 15:
+    nameBytes = value.encode("utf-8", "surrogateescape")
+    if len(nameBytes) > 15:
       raise FilesystemError("Volume name too long.")
     self._volName = value
-    self.__writeData(120, pack("<{0}sB".format(len(self._volName)), self._volName, 0))
+    self.__writeData(120, pack("<{0}sB".format(len(nameBytes)), nameBytes, 0))
 
 
 
@@ -316,31 +351,17 @@ class _Superblock(object):
     numInodesPerGroup = blockSize * 8
     numResBlocks = int(numBlocks * 0.05)
     numBlocksPerGroup = blockSize * 8
-    numBlockGroups = int(ceil(float(numBlocks) / numBlocksPerGroup))
+    numBlockGroups = -(-numBlocks // numBlocksPerGroup)
 
     if blockSize > 1024:
       firstBlockId = 0
     else:
       firstBlockId = 1
     
-    copyBlockGroupIds = []
-    if numBlockGroups > 1:
-      copyBlockGroupIds.append(1)
-      last3 = 3
-      while last3 < numBlockGroups:
-        copyBlockGroupIds.append(last3)
-        last3 *= 3
-      last5 = 5
-      while last5 < numBlockGroups:
-        copyBlockGroupIds.append(last5)
-        last5 *= 5
-      last7 = 7
-      while last7 < numBlockGroups:
-        copyBlockGroupIds.append(last7)
-        last7 *= 7
-
-    bgdtBlocks = int(ceil(float(numBlockGroups * 32) / blockSize))
-    inodeTableBlocks = int(ceil(float(numInodesPerGroup * inodeSize) / blockSize))
+    copyBlockGroupIds = _getCopyBlockGroupIds(numBlockGroups)[1:] # the primary copy is counted separately
+
+    bgdtBlocks = -(-numBlockGroups * 32 // blockSize)
+    inodeTableBlocks = -(-numInodesPerGroup * inodeSize // blockSize)
     numFreeBlocks = (numBlocks - firstBlockId - inodeTableBlocks * numBlockGroups - 2 * numBlockGroups -
                     (1 + bgdtBlocks) * (len(copyBlockGroupIds) + 1))
     
@@ -354,7 +375,7 @@ class _Superblock(object):
         copyBlockGroupIds.remove(lastBgId)
       numBlockGroups -= 1
       numBlocks = numBlockGroups * numBlocksPerGroup
-      bgdtBlocks = int(ceil(float(numBlockGroups * 32) / blockSize))
+      bgdtBlocks = -(-numBlockGroups * 32 // blockSize)
       numFreeBlocks = (numBlocks - firstBlockId - inodeTableBlocks * numBlockGroups - 2 * numBlockGroups -
                       (1 + bgdtBlocks) * (len(copyBlockGroupIds) + 1))
     
@@ -387,8 +408,8 @@ class _Superblock(object):
     featuresCompatible = 0
     featuresIncompatible = 2
     featuresReadOnlyCompatible = 1
-    volName = "{0}".format(pack("B", 0))
-    lastMountPath = "/{0}".format(pack("B", 0))
+    volName = b"\0"
+    lastMountPath = b"/\0"
     
     sbBytes = pack("<7Ii5I6H4I2HI2H3I16s16s64s", numInodes, numBlocks, numResBlocks, numFreeBlocks, numFreeInodes,
                    firstBlockId, logBlockSize, logFragSize, numBlocksPerGroup, numFragsPerGroup,
@@ -396,9 +417,7 @@ class _Superblock(object):
                    magicNum, state, errorAction, revMinor, timeLastCheck, timeBetweenCheck, creatorOs,
                    revLevel, defResUid, defResGid, firstInodeIndex, inodeSize, bgNum, featuresCompatible,
                    featuresIncompatible, featuresReadOnlyCompatible, volumeId, volName, lastMountPath)
-    zeroFill = [0] * 824
-    fillFmt = ["B"] * 824
-    sbBytes = "{0}{1}".format(sbBytes, "".join(map(pack, fillFmt, zeroFill)))
+    sbBytes += b"\0" * 824
     
     device.write(byteOffset, sbBytes)
 
@@ -408,10 +427,7 @@ class _Superblock(object):
   @classmethod
   def read(cls, byteOffset, device):
     """Reads a superblock from the bytes at byteOffset in device and returns the superblock object."""
-    sbBytes = device.read(byteOffset, 1024)
-    if len(sbBytes) < 1024:
-      raise FilesystemError("Invalid superblock.")
-    return cls(sbBytes, byteOffset, device)
+    return cls(device.read(byteOffset, 1024), byteOffset, device)
 
 
   def __init__(self, sbBytes, byteOffset, device):
@@ -420,7 +436,7 @@ class _Superblock(object):
     self._device = device
 
     # read standard fields
-    fields = unpack_from("<7Ii5I6H4I2H", sbBytes)
+    fields = _FIELDS.unpack_from(sbBytes)
     self._numInodes = fields[0]
     self._numBlocks = fields[1]
     self._numResBlocks = fields[2]
@@ -441,36 +457,17 @@ class _Superblock(object):
     self._numMountsSinceCheck = fields[13]
     self._numMountsMax = fields[14]
     self._magicNum = fields[15]
-    if fields[16] == 1:
-      self._state = "VALID"
-    else:
-      self._state = "ERROR"
-    if fields[17] == 1:
-      self._errorAction = "CONTINUE"
-    elif fields[17] == 2:
-      self._errorAction = "RO"
-    else:
-      self._errorAction = "PANIC"
+    self._state = fields[16]
+    self._errorAction = fields[17]
     self._revMinor = fields[18]
     self._timeLastCheck = fields[19]
     self._timeBetweenCheck = fields[20]
-    if fields[21] == 0:
-      self._creatorOs = "LINUX"
-    elif fields[21] == 1:
-      self._creatorOs = "HURD"
-    elif fields[21] == 2:
-      self._creatorOs = "MASIX"
-    elif fields[21] == 3:
-      self._creatorOs = "FREEBSD"
-    elif fields[21] == 4:
-      self._creatorOs = "LITES"
-    else:
-      self._creatorOs = "UNDEFINED"
+    self._creatorOs = fields[21]
     self._revLevel = fields[22]
     self._defResUid = fields[23]
     self._defResGid = fields[24]
 
-    self._numBlockGroups = int(ceil(float(self._numBlocks) / self._numBlocksPerGroup))
+    self._numBlockGroups = -(-self._numBlocks // self._numBlocksPerGroup)
 
 
     # read additional fields
@@ -481,7 +478,7 @@ class _Superblock(object):
       self._featuresCompatible = 0
       self._featuresIncompatible = 0
       self._featuresReadOnlyCompatible = 0
-      self._volumeId = ""
+      self._volumeId = b""
       self._volName = ""
       self._lastMountPath = ""
       self._compAlgorithms = None
@@ -495,23 +492,23 @@ class _Superblock(object):
       self._defHashVersion = None
       self._defMountOptions = None
       self._firstMetaGroupId = None
-      self._copyBlockGroupIds = range(self._numBlockGroups)
+      self._copyBlockGroupIds = list(range(self._numBlockGroups))
 
     else:
-      fields = unpack_from("<I2H3I16s16s64sI2B2x16s3I4IB3x2I", sbBytes, 84)
+      fields = _EXTENDED_FIELDS.unpack_from(sbBytes, 84)
       self._firstInodeIndex = fields[0]
       self._inodeSize = fields[1]
       self.__groupNum = fields[2]
       self._featuresCompatible = fields[3]
       self._featuresIncompatible = fields[4]
       self._featuresReadOnlyCompatible = fields[5]
-      self._volumeId = fields[6].rstrip('\0')
-      self._volName = fields[7].rstrip('\0')
-      self._lastMountPath = fields[8].rstrip('\0')
+      self._volumeId = fields[6].rstrip(b"\0")
+      self._volName = fields[7].rstrip(b"\0").decode("utf-8", "surrogateescape")
+      self._lastMountPath = fields[8].rstrip(b"\0").decode("utf-8", "surrogateescape")
       self._compAlgorithms = fields[9]
       self._numPreallocateBlocksFile = fields[10]
       self._numPreallocateBlocksDir = fields[11]
-      self._journalSuperblockUuid = fields[12].rstrip('\0')
+      self._journalSuperblockUuid = fields[12].rstrip(b"\0")
       self._journalFileInodeNum = fields[13]
       self._journalFileDev = fields[14]
       self._lastOrphanInodeNum = fields[15]
@@ -524,23 +521,7 @@ class _Superblock(object):
       self._defMountOptions = fields[21]
       self._firstMetaGroupId = fields[22]
 
-      self._copyBlockGroupIds = []
-      self._copyBlockGroupIds.append(0)
-      if self._numBlockGroups > 1:
-        self._copyBlockGroupIds.append(1)
-        last3 = 3
-        while last3 < self._numBlockGroups:
-          self._copyBlockGroupIds.append(last3)
-          last3 *= 3
-        last5 = 5
-        while last5 < self._numBlockGroups:
-          self._copyBlockGroupIds.append(last5)
-          last5 *= 5
-        last7 = 7
-        while last7 < self._numBlockGroups:
-          self._copyBlockGroupIds.append(last7)
-          last7 *= 7
-        self._copyBlockGroupIds.sort()
+      self._copyBlockGroupIds = _getCopyBlockGroupIds(self._numBlockGroups)
 
 
 
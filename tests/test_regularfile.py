@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Regression tests for writing regular files on an Ext2 filesystem.
+"""
+__license__ = "BSD"
+__copyright__ = "Copyright 2013, Michael R. Falcone"
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ext2 import Ext2Filesystem, FilesystemError
+
+
+class RegularFileWriteTest(unittest.TestCase):
+  """Tests the size recorded by Ext2RegularFile.write."""
+
+  def setUp(self):
+    """Creates and mounts a new 2 MB image with 1 KB blocks."""
+    self._tempDir = tempfile.mkdtemp()
+    imageFilename = os.path.join(self._tempDir, "test.img")
+    Ext2Filesystem.makeFromNewImageFile(imageFilename, 1024, 2048)
+    self._fs = Ext2Filesystem.fromImageFile(imageFilename)
+    self._fs.mount()
+    self._root = self._fs.rootDir
+
+  def tearDown(self):
+    """Unmounts and removes the image."""
+    self._fs.unmount()
+    shutil.rmtree(self._tempDir)
+
+  def testEmptyWriteKeepsSize(self):
+    """An empty write past the end of a file does not change its size."""
+    f = self._root.makeRegularFile("empty")
+    f.write(b"", 5000)
+    self.assertEqual(f.size, 0)
+    f.write(b"abc")
+    f.write(b"", 5000)
+    self.assertEqual(f.size, 3)
+
+  def testFailedWritePastEndKeepsSize(self):
+    """A write past the end of a file that runs out of blocks while filling the gap before its
+    position does not change the file's size."""
+    f = self._root.makeRegularFile("gap")
+    f.write(b"abc")
+    self.assertRaises(FilesystemError, f.write, b"x", 8192 * 1024)
+    self.assertEqual(f.size, 3)
+
+  def testFailedWriteCoversWrittenBytes(self):
+    """A write that runs out of blocks part way sets the size to cover only the bytes that were
+    written."""
+    f = self._root.makeRegularFile("full")
+    self.assertRaises(FilesystemError, f.write, b"y" * (4096 * 1024))
+    self.assertTrue(0 < f.size < 4096 * 1024)
+    self.assertEqual(f.size % 1024, 0)
+    self.assertEqual(b"".join(f.blocks()), b"y" * f.size)
+
+
+if __name__ == "__main__":
+  unittest.main()